@@ -3,16 +3,21 @@ import dash_core_components as dcc
 import dash_html_components as html 
 import dash_bootstrap_components as dbc 
 import dash_table
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from get_data import get_global_data, get_asean_dailydf #, _top20_summary_desc, get_top20_summarydf , get_PH_topline_data
-from trace_figure import load_lineplot_fig, load_bubbleplot_fig, generate_hexcolors
-from ytnews_scraper import _news_channels_, get_latest_ytnewslinks, get_all_latestnews
-from revise_covid19 import scrape_covid19_data, clean_covid19_data, filter_asean_data
+from trace_figure import load_lineplot_fig, load_comparison_fig, load_bubbleplot_fig, generate_hexcolors, LINEPLOT_METRICS
+from data_snapshot import DataRefresher, REFRESH_INTERVAL_SECONDS
+from figure_cache import FigureCache
+from response_cache import ResponseCache
+from columnar_store import add_rate_strings, format_date, COUNT_COLUMNS
+from number_format import format_counts, format_numbers
 import pandas as pd
+import numpy as np
 import locale # Used for formatting large number to have commas
-from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
+import os
+import functools
+import threading
+import flask
 
 # Create Dash main instance
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SLATE])
@@ -24,12 +29,20 @@ server = app.server
 #ph_topline_data = get_PH_topline_data() # Latest data on PH from: https://ncovph.com/
 #print('Fetched Topline Data from API (https://ncovph.com/):')
 #print(ph_topline_data)
-df = pd.read_csv('datasets/revised_covid_19_data.csv')
-asean_df = pd.read_csv('datasets/asean_covid_19_data.csv')
+# The datasets are read from a snapshot that a background thread replaces when the
+# pipeline rewrites the files (see data_snapshot.py). The callbacks and the page layout
+# read refresher.snapshot.
+refresher = DataRefresher(interval=int(os.environ.get('DATA_REFRESH_SECONDS', REFRESH_INTERVAL_SECONDS)),
+                          pipeline_interval=int(os.environ['PIPELINE_INTERVAL_SECONDS']) if 'PIPELINE_INTERVAL_SECONDS' in os.environ else None)
+if refresher.interval > 0:
+    refresher.start()
+lineplot_cache = FigureCache() # Built line plots by (country, resolution, metric)
+# Layout and callback responses of the current data version, precompressed and validated by ETag
+response_cache = ResponseCache(server, version=lambda: refresher.snapshot.version)
 
 # Generate color codes for each country bubble
 #latest_asean_df = asean_df[asean_df['date'] == asean_df.iloc[-1]['date']]
-color_settings = generate_hexcolors(counts=len(asean_df['country'].unique()))
+color_settings = generate_hexcolors(counts=len(refresher.snapshot.asean_store.countries))
 
 # DASHBOARD COMPONENTS #
 ### NAVIGATION BAR ###
@@ -52,34 +65,40 @@ navbar = dbc.NavbarSimple(dbc.NavItem(children=[html.A(html.Img(src="https://ima
 # CONTENT 1: TOPLINE DATA ON PHILIPPINES
 locale.setlocale(locale.LC_ALL, '')
 
-PH_kaggle_filter = (df['country'] == 'Philippines') & (df['date'] == df.iloc[-1]['date'])
-PH_kaggle_df = df[PH_kaggle_filter]
-
-topline_header1 = [html.Thead(html.Tr([html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered")]))]
-topline_body1 = [html.Tbody(children=[html.Tr(children = [
-                                                         html.Td(html.H2(PH_kaggle_df['confirmed'])),   # From Kaggle
-                                                         html.Td(html.H2(PH_kaggle_df['deaths'])),      # From Kaggle
-                                                         html.Td(html.H2(PH_kaggle_df['recovered']))    # From Kaggle
-                                                         ])                   
-                                     ])]
-
-topline_header2 = [html.Thead(html.Tr([html.Th("Active"), html.Th("Fatality Rate"), html.Th("Recovery Rate")]))]
-topline_body2 = [html.Tbody(children=[html.Tr(children = [
-                                                         html.Td(html.H2(PH_kaggle_df['active'])),          # From Kaggle
-                                                         html.Td(html.H2(PH_kaggle_df['death_rate'])),      # From Kaggle
-                                                         html.Td(html.H2(PH_kaggle_df['recovery_rate']))    # From Kaggle
-                                                         ])                   
-                                     ])]
-
-topline_table1 = dbc.Table(topline_header1 + topline_body1, bordered=False)
-topline_table2 = dbc.Table(topline_header2 + topline_body2, bordered=False)
-
-topline_left = dbc.Col(children=[html.H5(f"Philippines as of {df.iloc[-1]['date']}", className="display-5"),
-                                 html.Hr(className="my-2"),
-                                 topline_table1,
-                                 html.Hr(className="my-2"),
-                                 topline_table2
-                                 ])
+def build_topline(df_store):
+    '''
+    Builds the column of the latest data on the Philippines
+    '''
+    PH_kaggle_df = add_rate_strings(df_store.latest_rows('Philippines').copy())
+    PH_counts = {column: format_counts(PH_kaggle_df[column]) for column in COUNT_COLUMNS}
+
+    topline_header1 = [html.Thead(html.Tr([html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered")]))]
+    topline_body1 = [html.Tbody(children=[html.Tr(children = [
+                                                             html.Td(html.H2(PH_counts['confirmed'])),   # From Kaggle
+                                                             html.Td(html.H2(PH_counts['deaths'])),      # From Kaggle
+                                                             html.Td(html.H2(PH_counts['recovered']))    # From Kaggle
+                                                             ])                   
+                                         ])]
+
+    topline_header2 = [html.Thead(html.Tr([html.Th("Active"), html.Th("Fatality Rate"), html.Th("Recovery Rate")]))]
+    topline_body2 = [html.Tbody(children=[html.Tr(children = [
+                                                             html.Td(html.H2(PH_counts['active'])),             # From Kaggle
+                                                             html.Td(html.H2(PH_kaggle_df['death_rate'])),      # From Kaggle
+                                                             html.Td(html.H2(PH_kaggle_df['recovery_rate']))    # From Kaggle
+                                                             ])                   
+                                         ])]
+
+    topline_table1 = dbc.Table(topline_header1 + topline_body1, bordered=False)
+    topline_table2 = dbc.Table(topline_header2 + topline_body2, bordered=False)
+
+    topline_left = dbc.Col(children=[html.H5(f"Philippines as of {format_date(df_store.latest_date)}", className="display-5"),
+                                     html.Hr(className="my-2"),
+                                     topline_table1,
+                                     html.Hr(className="my-2"),
+                                     topline_table2
+                                     ])
+
+    return topline_left
 
 # CONTENT 2: DATA SOURCE and ABOUT DASHBOARD
 topline_right = dbc.Col(children=[html.H5("Data Source", className="display-5"),
@@ -102,163 +121,330 @@ topline_right = dbc.Col(children=[html.H5("Data Source", className="display-5"),
                                   html.Small("The figure at the bottom is a global-scoped interactive line plot where you can check the COVID-19 data from all other countries.")
                                   ])
 
-upper_content_row = dbc.Row(children=[topline_left,topline_right])
-#############################################################
-upper_content = dbc.Jumbotron(children=[upper_content_row], #
-                              id='upper-content')           #
-#############################################################
+def build_upper_content(snapshot):
+    '''
+    Builds the topline data next to the data source and the description of the dashboard
+    '''
+    upper_content_row = dbc.Row(children=[build_topline(snapshot.df_store),topline_right])
+    #############################################################
+    upper_content = dbc.Jumbotron(children=[upper_content_row], #
+                                  id='upper-content')           #
+    #############################################################
+
+    return upper_content
 
 ### MIDDLE CONTENT ###
 # CONTENT 1: DAILY STANDINGS OF ASEAN COUNTRIES
-asean_date = asean_df['date'].iloc[-1] # Initially selected date
-asean_datefiltered = get_asean_dailydf(date=asean_date,df=asean_df)
-
-# Using Bootstrap Table
-asean_header = [html.Thead(html.Tr([html.Th('Rank'),html.Th('Country'),html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered"), html.Th('Active Cases'), html.Th('Death Rate'), html.Th('Recovery Rate')]))] 
-asean_rows = [html.Tr([ html.Td(html.Small(i)), \
-                        html.Td(html.Small(asean_datefiltered.loc[i]['country'])), \
-                        html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['confirmed'], grouping=True))), \
-                        html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['deaths'], grouping=True))), \
-                        html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['recovered'], grouping=True))), \
-                        html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['active'], grouping=True))), \
-                        html.Td(html.Small(asean_datefiltered.loc[i]['death_rate'])), \
-                        html.Td(html.Small(asean_datefiltered.loc[i]['recovery_rate']))]) for i in asean_datefiltered.index
-             ]
-asean_body = [html.Tbody(children=asean_rows)]
-asean_table = dbc.Table(asean_header + asean_body, bordered=False)
-
-# Change Date Format
-parsed_aseandate = datetime.strptime(str(asean_date)[:10],"%m/%d/%Y")
-revised_aseandate = datetime.strftime(parsed_aseandate,"%B %-d, %Y")
-
-# Construct Slider
-asean_days = len(asean_df['date'].unique())
-
-# Slider marks
-asean_day0 = df['date'].unique()[round(asean_days*0)][:5]
-asean_dayQ1= df['date'].unique()[round(asean_days*0.1)][:5]
-asean_dayQ2= df['date'].unique()[round(asean_days*0.2)][:5]
-asean_dayQ3= df['date'].unique()[round(asean_days*0.3)][:5]
-asean_dayQ4= df['date'].unique()[round(asean_days*0.4)][:5]
-asean_dayQ5= df['date'].unique()[round(asean_days*0.5)][:5]
-asean_dayQ6= df['date'].unique()[round(asean_days*0.6)][:5]
-asean_dayQ7= df['date'].unique()[round(asean_days*0.7)][:5]
-asean_dayQ8= df['date'].unique()[round(asean_days*0.8)][:5]
-asean_dayQ9= df['date'].unique()[round(asean_days*0.9)][:5]
-asean_dayN = df['date'].unique()[round(asean_days*1)-1][:5]
-
-# Attempt to create a dictionary comprehension
-#cents = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]
-#slider_marks = { round(asean_days*cent) : df['date'].unique()[round(asean_days*cent)][:5] \
-#                 for cent in cents }
-
-asean_slider = dbc.Card(children=[html.Br(),
-                                  dcc.Slider(min=0, max=len(asean_df['date'].unique()) - 1,
-                                  marks={0: asean_day0,
-                                         round(asean_days*0.1,): asean_dayQ1,
-                                         round(asean_days*0.2,): asean_dayQ2,
-                                         round(asean_days*0.3,): asean_dayQ3,
-                                         round(asean_days*0.4,): asean_dayQ4,
-                                         round(asean_days*0.5,): asean_dayQ5,
-                                         round(asean_days*0.6,): asean_dayQ6,
-                                         round(asean_days*0.7,): asean_dayQ7,
-                                         round(asean_days*0.8,): asean_dayQ8,
-                                         round(asean_days*0.9,): asean_dayQ9,
-                                         len(asean_df['date'].unique()) - 1 : asean_dayN  
-                                        },
-                                  #marks=slider_marks,
-                                  id='asean-slider')
-                                  ],
-                         className='mb-3'
-                         )
-
-asean_table_container = dbc.Container(children=[html.H5(f"ASEAN Daily Standings ({str(revised_aseandate)})"),
-                                                html.P("Use slider below to see daily changes. The slider affects both the table and the bubble plot.",
-                                                       className="display-7"),
-                                                asean_table
-                                                ],id='asean-table'
-                                     )
-
-# Construct Bubble Plot
-asean_bubble_graph = dcc.Graph(figure=load_bubbleplot_fig(df=asean_df,date=asean_date,color_settings=color_settings),
-                               id='asean-bubble')
-
-# Construct News Headlines Section
-news_df = pd.read_csv('datasets/news.csv')
-
-asean_news_rows = html.Div([dbc.Row(dbc.Col(html.Small(children=[html.A(news_df.iloc[i]['title'], href=news_df.iloc[i]['url']), \
-                                                                 html.Small(' -- '), \
-                                                                 html.Img(src=news_df.iloc[i]['img-src'], alt=news_df.iloc[i]['channel'], width=20, height=20), \
-                                                                 html.Small(' | ' + news_df.iloc[i]['date'])]))) \
-                                                                 for i in news_df.index],
-                            id='asean-news')
-
-asean_news_container = dbc.Container(children = [asean_news_rows,
-                                                 #dcc.Interval(id='news-interval-component',
-                                                 #interval=1800000,
-                                                 #n_intervals=0)
-                                                 ])
-
-#################################################################
-middle_content = dbc.Jumbotron(children=[asean_table_container, #
-                                         asean_slider,          #
-                                         asean_bubble_graph,    #
-                                         html.Small("NOTE: The size of the bubble indicates the number of confirmed cases."),
-                                         html.Hr(className="my-2"),
-                                         html.H5(f"Asian News Headlines"),
-                                         asean_news_container   #
-                                         ])                     #
-#################################################################
+ASEAN_TABLE_NOTE = "Use slider below to see daily changes. The slider affects both the table and the bubble plot."
+
+def format_decimals(values):
+    return format_numbers(values, decimals=1)
+
+# Columns of the ASEAN table for each choice of metric, after 'Rank' and 'Country':
+# (title, column, function formatting the column), the countries are ranked by the column 'sort_by'.
+# All columns are stored by the cleaning stage (see derived_metrics.py), a view only selects them.
+ASEAN_TABLE_VIEWS = {'cumulative': {'label': 'Cumulative',
+                                    'sort_by': 'confirmed',
+                                    'columns': [('Confirmed', 'confirmed', format_counts),
+                                                ('Deaths', 'deaths', format_counts),
+                                                ('Recovered', 'recovered', format_counts),
+                                                ('Active Cases', 'active', format_counts),
+                                                ('Death Rate', 'death_rate', list),
+                                                ('Recovery Rate', 'recovery_rate', list)]},
+                     'new': {'label': 'New Cases',
+                             'sort_by': 'new_confirmed_avg7',
+                             'columns': [('New Confirmed', 'new_confirmed', format_counts),
+                                         ('New Deaths', 'new_deaths', format_counts),
+                                         ('New Recovered', 'new_recovered', format_counts),
+                                         ('Confirmed (7-day avg)', 'new_confirmed_avg7', format_decimals),
+                                         ('Deaths (7-day avg)', 'new_deaths_avg7', format_decimals),
+                                         ('Doubling Time (days)', 'doubling_days', format_decimals)]},
+                     'per_million': {'label': 'Per Million People',
+                                     'sort_by': 'confirmed_per_million',
+                                     'columns': [('Confirmed per Million', 'confirmed_per_million', format_decimals),
+                                                 ('Deaths per Million', 'deaths_per_million', format_decimals),
+                                                 ('Death Rate', 'death_rate', list),
+                                                 ('Recovery Rate', 'recovery_rate', list)]}}
+ASEAN_TABLE_VIEW = 'cumulative' # Initially Selected Metric of the ASEAN table
+asean_view_options = [{'label': table_view['label'], 'value': view} for view, table_view in ASEAN_TABLE_VIEWS.items()]
+
+def asean_table_header(view):
+    return ['Rank', 'Country'] + [title for title, _, _ in ASEAN_TABLE_VIEWS[view]['columns']]
+
+def build_asean_standings(date, df, view=ASEAN_TABLE_VIEW):
+    '''
+    Builds the children of the ASEAN table container for a chosen date
+    df - ASEAN dataset (or its series) or only its rows on date
+    view - str, one of the keys of ASEAN_TABLE_VIEWS
+    '''
+    table_view = ASEAN_TABLE_VIEWS[view]
+    asean_datefiltered = get_asean_dailydf(date=date,df=df,sort_by=table_view['sort_by'])
+
+    # Using Bootstrap Table
+    asean_header = [html.Thead(html.Tr([html.Th(title) for title in asean_table_header(view)]))] 
+    # Each column is formatted at once, the rows are then read from the formatted columns
+    asean_columns = [asean_datefiltered.index.tolist(),
+                     asean_datefiltered['country'].astype(str).tolist()] + \
+                    [format_cells(asean_datefiltered[column]) for _, column, format_cells in table_view['columns']]
+    asean_rows = [html.Tr([html.Td(html.Small(cell)) for cell in row]) for row in zip(*asean_columns)]
+    asean_body = [html.Tbody(children=asean_rows)]
+    asean_table = dbc.Table(asean_header + asean_body, bordered=False)
+
+    # Change Date Format
+    revised_aseandate = format_date(date,"%B %-d, %Y")
+
+    return [html.H5(f"ASEAN Daily Standings ({str(revised_aseandate)})"),
+            html.P(ASEAN_TABLE_NOTE, className="display-7"),
+            asean_table
+            ]
+
+# Slider positions kept in memory, a few hundred dates fit entirely
+ASEAN_STATES_CACHE_SIZE = 512
+
+@functools.lru_cache(maxsize=ASEAN_STATES_CACHE_SIZE)
+def asean_slider_state(store, series, date_index):
+    '''
+    Builds the ASEAN table children of every view (in a dictionary by view) and the bubble figure
+    (as a dictionary) of a slider position. The rows of the date are sliced once for all of them,
+    a position is built once and later drags or view changes cost a dictionary lookup.
+    The data store and series are part of the key,
+    so a new data version never reads the states of the previous one.
+    The returned state is shared between requests and must not be modified.
+    '''
+    date = store.date_at(date_index)
+    asean_bydate = series.date_frame(date)
+    bubble_fig = load_bubbleplot_fig(df=asean_bydate,date=date,color_settings=color_settings)
+
+    tables = {view: build_asean_standings(date, df=asean_bydate, view=view) for view in ASEAN_TABLE_VIEWS}
+
+    return tables, bubble_fig.to_dict()
+
+# The states of a replaced snapshot are never read again
+refresher.add_listener(lambda snapshot: asean_slider_state.cache_clear())
+
+
+# 'clientside' renders the slider states in the browser (assets/asean_slider.js)
+# from the data shipped once in a dcc.Store, 'server' builds them in the callbacks below
+ASEAN_SLIDER_MODE = os.environ.get('ASEAN_SLIDER_MODE', 'clientside')
+
+def build_asean_client_data(store, series):
+    '''
+    Returns the compact ASEAN data used by the clientside slider, as json-compatible lists:
+    counts and rates by date and country (in the order of the series) for the bubble plot,
+    and for each view of the table its cells formatted by the server and the values ranking the countries
+    '''
+    frames = [series.date_frame(date) for date in store.dates]
+    # The rows of all dates are formatted at once, then split back by date
+    rows = add_rate_strings(pd.concat(frames, ignore_index=True))
+    date_bounds = np.cumsum([len(frame) for frame in frames])[:-1]
+    def by_date(columns):
+        return [date_rows.tolist() for date_rows in np.split(np.column_stack(columns), date_bounds)]
+    bubble_layout = load_bubbleplot_fig(df=series,date=store.latest_date,color_settings=color_settings).to_dict()['layout']
+    bubble_layout.pop('title', None)
+
+    return {'dates': [format_date(date, '%Y-%m-%d') for date in store.dates],
+            'display_dates': [format_date(date, "%B %-d, %Y") for date in store.dates],
+            'countries': [str(country) for country in frames[-1]['country']],
+            'counts': by_date([rows[column].to_numpy() for column in COUNT_COLUMNS]),
+            'rates': by_date([rows[column].to_numpy() for column in ['death_rate_float','recovery_rate_float']]),
+            'views': {view: {'header': asean_table_header(view),
+                             'cells': by_date([format_cells(rows[column]) for _, column, format_cells in table_view['columns']]),
+                             'rank_values': [values.tolist() for values in np.split(rows[table_view['sort_by']].to_numpy('float64'), date_bounds)]}
+                      for view, table_view in ASEAN_TABLE_VIEWS.items()},
+            'colors': color_settings,
+            'table_note': ASEAN_TABLE_NOTE,
+            'bubble_layout': bubble_layout}
+
+def build_middle_content(snapshot):
+    '''
+    Builds the ASEAN daily standings, their bubble plot and the news headlines
+    '''
+    asean_store = snapshot.asean_store
+    asean_series = snapshot.asean_series
+
+    asean_data_store = dcc.Store(id='asean-data',
+                                 data=build_asean_client_data(asean_store, asean_series) if ASEAN_SLIDER_MODE == 'clientside' else None)
+
+    # Construct Slider
+    asean_days = len(asean_store.dates)
+
+    # Slider marks
+    asean_day0 = format_date(asean_store.date_at(round(asean_days*0)),'%m/%d')
+    asean_dayQ1= format_date(asean_store.date_at(round(asean_days*0.1)),'%m/%d')
+    asean_dayQ2= format_date(asean_store.date_at(round(asean_days*0.2)),'%m/%d')
+    asean_dayQ3= format_date(asean_store.date_at(round(asean_days*0.3)),'%m/%d')
+    asean_dayQ4= format_date(asean_store.date_at(round(asean_days*0.4)),'%m/%d')
+    asean_dayQ5= format_date(asean_store.date_at(round(asean_days*0.5)),'%m/%d')
+    asean_dayQ6= format_date(asean_store.date_at(round(asean_days*0.6)),'%m/%d')
+    asean_dayQ7= format_date(asean_store.date_at(round(asean_days*0.7)),'%m/%d')
+    asean_dayQ8= format_date(asean_store.date_at(round(asean_days*0.8)),'%m/%d')
+    asean_dayQ9= format_date(asean_store.date_at(round(asean_days*0.9)),'%m/%d')
+    asean_dayN = format_date(asean_store.date_at(round(asean_days*1)-1),'%m/%d')
+
+    # Attempt to create a dictionary comprehension
+    #cents = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]
+    #slider_marks = { round(asean_days*cent) : df['date'].unique()[round(asean_days*cent)][:5] \
+    #                 for cent in cents }
+
+    asean_slider = dbc.Card(children=[html.Br(),
+                                      dcc.Slider(min=0, max=len(asean_store.dates) - 1,
+                                      marks={0: asean_day0,
+                                             round(asean_days*0.1,): asean_dayQ1,
+                                             round(asean_days*0.2,): asean_dayQ2,
+                                             round(asean_days*0.3,): asean_dayQ3,
+                                             round(asean_days*0.4,): asean_dayQ4,
+                                             round(asean_days*0.5,): asean_dayQ5,
+                                             round(asean_days*0.6,): asean_dayQ6,
+                                             round(asean_days*0.7,): asean_dayQ7,
+                                             round(asean_days*0.8,): asean_dayQ8,
+                                             round(asean_days*0.9,): asean_dayQ9,
+                                             len(asean_store.dates) - 1 : asean_dayN  
+                                            },
+                                      #marks=slider_marks,
+                                      id='asean-slider')
+                                      ],
+                             className='mb-3'
+                             )
+
+    asean_table_container = dbc.Container(children=asean_slider_state(asean_store, asean_series, len(asean_store.dates) - 1)[0][ASEAN_TABLE_VIEW],
+                                         id='asean-table'
+                                         )
+    asean_view_radio = dcc.RadioItems(options=asean_view_options, value=ASEAN_TABLE_VIEW, id='asean-table-view',
+                                      labelStyle={'display': 'inline-block', 'margin-right': '12px'})
+
+    # Construct Bubble Plot
+    asean_bubble_graph = dcc.Graph(figure=asean_slider_state(asean_store, asean_series, len(asean_store.dates) - 1)[1],
+                                   id='asean-bubble')
+
+    # Construct News Headlines Section
+    news_df = snapshot.news_df
+
+    asean_news_rows = html.Div([dbc.Row(dbc.Col(html.Small(children=[html.A(news_df.iloc[i]['title'], href=news_df.iloc[i]['url']), \
+                                                                     html.Small(' -- '), \
+                                                                     html.Img(src=news_df.iloc[i]['img-src'], alt=news_df.iloc[i]['channel'], width=20, height=20), \
+                                                                     html.Small(' | ' + news_df.iloc[i]['date'])]))) \
+                                                                     for i in news_df.index],
+                                id='asean-news')
+
+    asean_news_container = dbc.Container(children = [asean_news_rows,
+                                                     #dcc.Interval(id='news-interval-component',
+                                                     #interval=1800000,
+                                                     #n_intervals=0)
+                                                     ])
+
+    #################################################################
+    middle_content = dbc.Jumbotron(children=[asean_data_store,      #
+                                             asean_table_container, #
+                                             asean_view_radio,      #
+                                             asean_slider,          #
+                                             asean_bubble_graph,    #
+                                             html.Small("NOTE: The size of the bubble indicates the number of confirmed cases."),
+                                             html.Hr(className="my-2"),
+                                             html.H5(f"Asian News Headlines"),
+                                             asean_news_container   #
+                                             ])                     #
+    #################################################################
+
+    return middle_content
 
 ### LOWER CONTENT ###
 # CONTENT 1: LINE PLOT OF GLOBAL DATA
 country = 'Philippines' # Initially Selected Country
-# Setup Dropdown Menu
-country_list = list(df['country'].unique().copy())
-country_list.sort(reverse=False) # Sort list in ascending order
-country_dictlist = [{'label': country, 'value': country} for country in country_list] # Create a list of dictionary as reference for the dropdown menu
-country_dropdown = dcc.Dropdown(options=country_dictlist, value=country, id='country-selection')
-
-# Setup Initial Graph
-#lineplot_fig = load_lineplot_fig(df=df,country=country)
-line_graph = dcc.Graph(figure=load_lineplot_fig(df=df,country=country), id='selected-country')
-line_graph_container = dbc.Jumbotron(children=[ html.H4("COVID-19 Global Data: Line Plot"),
-                                                html.H5("Select Country from dropdown", className="display-5"),
-                                                country_dropdown,
-                                                line_graph,
-                                                html.Small(f"Data on this graph is as of {df.iloc[-1]['date']}"),                                                
-                                                ])
+resolution = 'auto' # Initially Selected Resolution
+resolution_options = [{'label': label, 'value': value} for label, value in [('Auto','auto'), ('Daily','daily'), ('Weekly','weekly'), ('Monthly','monthly')]]
+lineplot_metric = 'cumulative' # Initially Selected Metric, one of the keys of trace_figure.LINEPLOT_METRICS
+lineplot_metric_options = [{'label': label, 'value': value} for label, value in [('Cumulative','cumulative'), ('New Cases (7-day avg)','new'), ('Per Million People','per_million')]]
+comparison_metric = 'confirmed' # Initially Selected Metric of the comparison plot
+comparison_metric_options = [{'label': label, 'value': value} for label, value in [('Confirmed','confirmed'), ('Deaths','deaths'), ('Recovered','recovered'), ('Active','active')]]
+
+def comparison_figure(snapshot, countries, metric):
+    '''
+    Returns the comparison plot of the countries as a dictionary, cached per data version
+    '''
+    countries = tuple(countries or ())
+    return lineplot_cache.get(('comparison', countries, metric), snapshot.version,
+                              lambda: load_comparison_fig(df=snapshot.df_series,countries=countries,metric=metric))
 
 # SUBCONTENT: Layout of Country Summary under the line plot
-summary_filter = (df['date'] == df.iloc[-1]['date']) & (df['country'] == country)
-latest_confirmed = locale.format_string("%d", df[summary_filter]['confirmed'], grouping=True)
-latest_deaths = locale.format_string("%d", df[summary_filter]['deaths'], grouping=True)
-latest_recovered = locale.format_string("%d", df[summary_filter]['recovered'], grouping=True)
-latest_active = locale.format_string("%d", df[summary_filter]['active'], grouping=True)
-latest_deathrate = str(df[summary_filter]['death_rate'] * 100) + " %"
-latest_recoveryrate = str(df[summary_filter]['recovery_rate'] * 100) + " %"
-
-summary_header = [html.Th('Country'),html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered"), html.Th('Active Cases'), html.Th('Death Rate'), html.Th('Recovery Rate')] 
-summary_row = [ html.Tr([html.Td(country),
-                         html.Td(latest_confirmed),
-                         html.Td(latest_deaths),
-                         html.Td(latest_recovered),
-                         html.Td(latest_active),
-                         html.Td(latest_deathrate),
-                         html.Td(latest_recoveryrate)
-                         ])]
-summary_body = [html.Tbody(children=summary_row)]
-summary_table = dbc.Table(summary_header + summary_body, bordered=False)
-country_summary = dbc.Jumbotron(children=[html.P(f"Latest Statistics on {country} as of {df.iloc[-1]['date']}"),
-                                          summary_table
-                                          ],
-                                          id='country-summary')
-
-lower_content = dbc.Container(children=[line_graph_container,
-                                        country_summary,
-                                        #bubble_graph_container,
-                                        #top20_summary,
-                                        ])
+def build_country_summary(df_store, country):
+    '''
+    Builds the children of the summary of the latest data on a country
+    '''
+    summary_df = add_rate_strings(df_store.latest_rows(country).copy())
+    latest_confirmed, latest_deaths, latest_recovered, latest_active = [format_counts(summary_df[column])[0] for column in COUNT_COLUMNS]
+    latest_deathrate = summary_df['death_rate']
+    latest_recoveryrate = summary_df['recovery_rate']
+
+    summary_header = [html.Th('Country'),html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered"), html.Th('Active Cases'), html.Th('Death Rate'), html.Th('Recovery Rate')] 
+    summary_row = [ html.Tr([html.Td(country),
+                             html.Td(latest_confirmed),
+                             html.Td(latest_deaths),
+                             html.Td(latest_recovered),
+                             html.Td(latest_active),
+                             html.Td(latest_deathrate),
+                             html.Td(latest_recoveryrate)
+                             ])]
+    summary_body = [html.Tbody(children=summary_row)]
+    summary_table = dbc.Table(summary_header + summary_body, bordered=False)
+
+    return [html.P(f"Latest Statistics on {country} as of {format_date(df_store.latest_date)}"),
+            summary_table
+            ]
+
+def build_lower_content(snapshot):
+    '''
+    Builds the line plot of a country and the summary of its latest data
+    '''
+    df_store = snapshot.df_store
+    # Setup Dropdown Menu
+    country_list = list(df_store.countries)
+    country_list.sort(reverse=False) # Sort list in ascending order
+    country_dictlist = [{'label': country, 'value': country} for country in country_list] # Create a list of dictionary as reference for the dropdown menu
+    country_dropdown = dcc.Dropdown(options=country_dictlist, value=country, id='country-selection')
+    resolution_radio = dcc.RadioItems(options=resolution_options, value=resolution, id='resolution-selection',
+                                      labelStyle={'display': 'inline-block', 'margin-right': '12px'})
+    metric_radio = dcc.RadioItems(options=lineplot_metric_options, value=lineplot_metric, id='lineplot-metric',
+                                  labelStyle={'display': 'inline-block', 'margin-right': '12px'})
+
+    # Setup Initial Graph
+    #lineplot_fig = load_lineplot_fig(df=df,country=country)
+    line_graph = dcc.Graph(figure=lineplot_cache.get((country, resolution, lineplot_metric), snapshot.version,
+                                                      lambda: load_lineplot_fig(df=snapshot.df_series,country=country,resolution=resolution,rollups=snapshot.df_rollups,metric=lineplot_metric)),
+                           id='selected-country')
+    line_graph_container = dbc.Jumbotron(children=[ html.H4("COVID-19 Global Data: Line Plot"),
+                                                    html.H5("Select Country from dropdown", className="display-5"),
+                                                    country_dropdown,
+                                                    resolution_radio,
+                                                    metric_radio,
+                                                    line_graph,
+                                                    html.Small(f"Data on this graph is as of {format_date(df_store.latest_date)}"),                                                
+                                                    ])
+
+    country_summary = dbc.Jumbotron(children=build_country_summary(df_store, country),
+                                    id='country-summary')
+
+    # CONTENT 2: COMPARISON PLOT OF SEVERAL COUNTRIES (initially the ASEAN countries)
+    comparison_countries = [str(country) for country in snapshot.asean_store.countries]
+    comparison_dropdown = dcc.Dropdown(options=country_dictlist, value=comparison_countries, multi=True, id='comparison-selection')
+    comparison_radio = dcc.RadioItems(options=comparison_metric_options, value=comparison_metric, id='comparison-metric',
+                                      labelStyle={'display': 'inline-block', 'margin-right': '12px'})
+    comparison_graph = dcc.Graph(figure=comparison_figure(snapshot, comparison_countries, comparison_metric),
+                                 id='comparison-graph')
+    comparison_container = dbc.Jumbotron(children=[ html.H4("COVID-19 Global Data: Country Comparison"),
+                                                    html.H5("Select up to 50 countries from dropdown", className="display-5"),
+                                                    comparison_dropdown,
+                                                    comparison_radio,
+                                                    comparison_graph
+                                                    ])
+
+    lower_content = dbc.Container(children=[line_graph_container,
+                                            country_summary,
+                                            comparison_container,
+                                            #bubble_graph_container,
+                                            #top20_summary,
+                                            ])
+
+    return lower_content
 
 ### FOOTER CONTENT ###
 # Setup Footer Content
@@ -291,93 +477,145 @@ footer_row = dbc.Row([dbc.Col(footer_col1),dbc.Col([html.Hr(className="my-2")]),
 
 footer = dbc.Container(footer_row)
 
-dash_contents = html.Div(children=[ navbar,           
-                                    upper_content,    
-                                    middle_content,   
-                                    lower_content,    
-                                    footer],
-                         id='dash-contents'
-                        )
-
 ##### MAIN LAYOUT OF WHOLE DASHBOARD PAGE ##############
-app.layout = dbc.Container(children=[dash_contents,    #
-                                     #dcc.Interval(id='interval-component',
-                                     #             interval=28800000,
-                                     #             n_intervals=0)
-                                     ])                #
+def build_layout(snapshot):
+    '''
+    Builds the layout of the whole dashboard page from the datasets of a snapshot
+    '''
+    dash_contents = html.Div(children=[ navbar,           
+                                        build_upper_content(snapshot),    
+                                        build_middle_content(snapshot),   
+                                        build_lower_content(snapshot),    
+                                        footer],
+                             id='dash-contents'
+                            )
+
+    return dbc.Container(children=[dash_contents,    #
+                                   #dcc.Interval(id='interval-component',
+                                   #             interval=28800000,
+                                   #             n_intervals=0)
+                                   ])                #
+
+# Layout of the current data version, built once per version (see serve_layout)
+page_layouts = {}
+page_layouts_lock = threading.Lock()
+
+def layout_of(snapshot):
+    '''
+    Returns the page layout of a snapshot, built on the first call for its version
+    Only the layout of the latest version is kept.
+    '''
+    layout = page_layouts.get(snapshot.version)
+    if layout is None:
+        layout = build_layout(snapshot)
+        with page_layouts_lock:
+            # A request still reading a replaced snapshot does not evict the current layout
+            if snapshot is refresher.snapshot:
+                page_layouts.clear()
+                page_layouts[snapshot.version] = layout
+
+    return layout
+
+def serve_layout():
+    '''
+    Called by dash on every page load, returns the prebuilt layout of the current data version
+    '''
+    return layout_of(refresher.snapshot)
+
+app.layout = serve_layout
+# The layout of a new snapshot is built by the refresher thread, not by the next page load
+refresher.add_listener(layout_of)
 ########################################################
 
 
 # CALLBACK SECTION #
+def visible_date_range(relayout_data):
+    '''
+    Returns the (start, end) dates of the x axis zoomed by the user, read from the relayoutData
+    of a graph, or None if the whole series is shown
+    '''
+    relayout_data = relayout_data or {}
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]'])
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+
+    return None
+
+def triggered_by(prop_id):
+    '''
+    Returns True if the input prop_id ('component-id.property') triggered the running callback
+    Outside of a request (a callback called directly) the given inputs are all taken as changed
+    '''
+    if not flask.has_request_context():
+        return True
+
+    return any(trigger['prop_id'] == prop_id for trigger in dash.callback_context.triggered)
+
 # Line Plot Callback
+# A zoom changes the visible range, for which the 'auto' resolution is chosen again.
+# The relayoutData of the graph keeps the last zoom when the figure is replaced,
+# so it is only read when the zoom itself triggered the callback.
 @app.callback(Output(component_id='selected-country', component_property='figure'),
-              [Input(component_id='country-selection', component_property='value')])
-def update_linefig(selected_country):
-    return load_lineplot_fig(df=df,country=selected_country)
+              [Input(component_id='country-selection', component_property='value'),
+               Input(component_id='resolution-selection', component_property='value'),
+               Input(component_id='lineplot-metric', component_property='value'),
+               Input(component_id='selected-country', component_property='relayoutData')])
+def update_linefig(selected_country, selected_resolution='auto', selected_metric='cumulative', relayout_data=None):
+    snapshot = refresher.snapshot
+    date_range = visible_date_range(relayout_data) if triggered_by('selected-country.relayoutData') else None
+    build_figure = lambda: load_lineplot_fig(df=snapshot.df_series,country=selected_country,resolution=selected_resolution,rollups=snapshot.df_rollups,metric=selected_metric,date_range=date_range)
+    # Every pan or zoom gives a new range, zoomed figures are built without pushing the whole series out of the cache
+    if date_range is not None:
+        return build_figure()
+    return lineplot_cache.get((selected_country, selected_resolution, selected_metric), snapshot.version, build_figure)
+
+# Comparison Plot Callback
+@app.callback(Output(component_id='comparison-graph', component_property='figure'),
+              [Input(component_id='comparison-selection', component_property='value'),
+               Input(component_id='comparison-metric', component_property='value')])
+def update_comparison_fig(selected_countries, selected_metric):
+    return comparison_figure(refresher.snapshot, selected_countries, selected_metric)
 
 @app.callback(Output(component_id='country-summary', component_property='children'),
               [Input(component_id='country-selection', component_property='value')])
 def update_country_summary(selected_country):
-    global country
-    country = selected_country
-    summary_filter = (df['date'] == df.iloc[-1]['date']) & (df['country'] == country)
-    latest_confirmed = locale.format_string("%d", df[summary_filter]['confirmed'], grouping=True)
-    latest_deaths = locale.format_string("%d", df[summary_filter]['deaths'], grouping=True)
-    latest_recovered = locale.format_string("%d", df[summary_filter]['recovered'], grouping=True)
-    latest_active = locale.format_string("%d", df[summary_filter]['active'], grouping=True)
-    latest_deathrate = df[summary_filter]['death_rate']
-    latest_recoveryrate = df[summary_filter]['recovery_rate']
-
-    summary_header = [html.Th('Country'),html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered"), html.Th('Active Cases'), html.Th('Death Rate'), html.Th('Recovery Rate')] 
-    summary_row = [html.Tr([html.Td(country), html.Td(latest_confirmed), html.Td(latest_deaths), html.Td(latest_recovered), html.Td(latest_active), html.Td(latest_deathrate), html.Td(latest_recoveryrate),])]
-    summary_body = [html.Tbody(children=summary_row)]
-    summary_table = dbc.Table(summary_header + summary_body, bordered=False)
-
-    return [html.P( f"Latest Statistics on {country} as of {df.iloc[-1]['date']}"),
-                    summary_table
-                    ]
-
-# ASEAN Table Callback
-@app.callback(Output(component_id='asean-table', component_property='children'),
-              [Input(component_id='asean-slider', component_property='value')])
-def update_asean_table(date_index):
-    global asean_date
-    global asean_datefiltered
-    asean_date = asean_df['date'].unique()[date_index]
-    asean_datefiltered = get_asean_dailydf(date=asean_date,df=asean_df)
-
-    # Using Bootstrap Table
-    asean_header = [html.Thead(html.Tr([html.Th('Rank'),html.Th('Country'),html.Th("Confirmed"), html.Th("Deaths"), html.Th("Recovered"), html.Th('Active Cases'), html.Th('Death Rate'), html.Th('Recovery Rate')]))] 
-    asean_rows = [  html.Tr([html.Td(html.Small(i)), \
-                    html.Td(html.Small(asean_datefiltered.loc[i]['country'])), \
-                    html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['confirmed'], grouping=True))), \
-                    html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['deaths'], grouping=True))), \
-                    html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['recovered'], grouping=True))), \
-                    html.Td(html.Small(locale.format_string("%d", asean_datefiltered.loc[i]['active'], grouping=True))), \
-                    html.Td(html.Small(asean_datefiltered.loc[i]['death_rate'])), \
-                    html.Td(html.Small(asean_datefiltered.loc[i]['recovery_rate']))]) for i in asean_datefiltered.index ]
-    asean_body = [html.Tbody(children=asean_rows)]
-    asean_table = dbc.Table(asean_header + asean_body, bordered=False)
-
-    # Change Date Format
-    parsed_aseandate = datetime.strptime(str(asean_date)[:10],"%m/%d/%Y")
-    revised_aseandate = datetime.strftime(parsed_aseandate,"%B %-d, %Y")
-
-    return [html.H5(f"ASEAN Daily Standings ({str(revised_aseandate)})"),
-            html.P("Use slider below to see daily changes. The slider affects both the table and the bubble plot.", 
-                    className="display-7"),
-            asean_table
-            ]
-
-# ASEAN Bubble Plot Callback
-@app.callback(Output(component_id='asean-bubble', component_property='figure'),
-              [Input(component_id='asean-slider', component_property='value')])
-def update_asean_bubble(date_index):
-    global asean_date
-    asean_date = asean_df['date'].unique()[date_index]
-    return load_bubbleplot_fig(df=asean_df,date=asean_date,color_settings=color_settings)
+    return build_country_summary(refresher.snapshot.df_store, selected_country)
+
+# ASEAN Table and Bubble Plot Callback
+# A single callback for both outputs, it only reads module state so that
+# the threads of a worker can run it concurrently
+def update_asean_standings(date_index, view=ASEAN_TABLE_VIEW):
+    snapshot = refresher.snapshot
+    # The slider has no value until it is moved, it then stands on the latest date (as in assets/asean_slider.js)
+    if date_index is None:
+        date_index = len(snapshot.asean_store.dates) - 1
+    tables, bubble_fig = asean_slider_state(snapshot.asean_store, snapshot.asean_series, date_index)
+    return tables[view or ASEAN_TABLE_VIEW], bubble_fig
+
+asean_standings_outputs = [Output(component_id='asean-table', component_property='children'),
+                           Output(component_id='asean-bubble', component_property='figure')]
+if ASEAN_SLIDER_MODE == 'clientside':
+    app.clientside_callback(ClientsideFunction(namespace='asean', function_name='updateStandings'),
+                            asean_standings_outputs,
+                            [Input(component_id='asean-slider', component_property='value'),
+                             Input(component_id='asean-table-view', component_property='value')],
+                            [State(component_id='asean-data', component_property='data')])
+else:
+    app.callback(asean_standings_outputs,
+                 [Input(component_id='asean-slider', component_property='value'),
+                  Input(component_id='asean-table-view', component_property='value')])(update_asean_standings)
+
+# Cache statistics
+@server.route('/stats/cache')
+def cache_stats():
+    return flask.jsonify({'worker_pid': os.getpid(),
+                          'lineplot_figures': lineplot_cache.stats(),
+                          'asean_slider_states': asean_slider_state.cache_info()._asdict(),
+                          'responses': response_cache.stats()})
 
 # LIVE-UPDATING CALLBACKS
+# The datasets are refreshed off the request path by the DataRefresher (see data_snapshot.py)
 """
 @app.callback(Output(component_id='asean-news', component_property='children'),
               [Input(component_id='news-interval-component', component_property='n_intervals')])
@@ -396,29 +634,6 @@ def live_update_news(n):
                                                  html.Small(' | ' + news_df.iloc[i]['date'])]))) \
                                                  for i in news_df.index]
 
-@app.callback(Output(component_id='dash-contents', component_property='children'),
-              [Input(component_id='interval-component', component_property='n_intervals')])
-def live_update_layout(n):
-    '''
-    Updates layout every 8 hours
-    '''
-    print(f"Live update commence: {str(datetime.now())}")
-    scrape_covid19_data()
-    clean_covid19_data()
-    filter_asean_data()
-    get_all_latestnews()
-
-    print("Reassigning variables of dataframes by reading updated csv files...")
-    global df
-    df = pd.read_csv('datasets/revised_covid_19_data.csv')
-    global asean_df
-    asean_df = pd.read_csv('datasets/asean_covid_19_data.csv')
-    global asean_date
-    asean_date = asean_df['date'].iloc[-1]
-    global news_df
-    news_df = pd.read_csv('datasets/news.csv')
-    print(f"Live update completed last {str(datetime.now())}!")
-    return [navbar, upper_content, middle_content, lower_content, footer]
 """
 # APP TRIGGER #
 if __name__ == '__main__':
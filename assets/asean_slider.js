@@ -0,0 +1,69 @@
+/*
+ * Clientside callbacks of the ASEAN slider (see ASEAN_SLIDER_MODE in app.py).
+ * The table and the bubble plot are rendered in the browser from the data
+ * shipped once in the 'asean-data' dcc.Store, without a request to the server.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    asean: (function () {
+        function component(namespace, type, props) {
+            return {namespace: namespace, type: type, props: props};
+        }
+
+        function html(type, children, props) {
+            return component('dash_html_components', type, Object.assign({children: children}, props));
+        }
+
+        function dateIndexOf(dateIndex, data) {
+            return (dateIndex === null || dateIndex === undefined) ? data.dates.length - 1 : dateIndex;
+        }
+
+        function renderTable(d, view, data) {
+            var tableView = data.views[view];
+            var dateCells = tableView.cells[d];
+            // Missing values (null) are ranked last, as by pandas
+            var rankValues = tableView.rank_values[d].map(function (value) { return value === null ? -Infinity : value; });
+
+            // Countries ranked by the values of the view, ties keep the order of the data
+            var order = data.countries.map(function (country, c) { return c; });
+            order.sort(function (a, b) { return (rankValues[b] - rankValues[a]) || (a - b); });
+
+            var header = html('Thead', html('Tr', tableView.header.map(function (title) {
+                return html('Th', title);
+            })));
+            var rows = order.map(function (c, i) {
+                var cells = [i + 1, data.countries[c]].concat(dateCells[c]);
+                return html('Tr', cells.map(function (cell) { return html('Td', html('Small', cell)); }));
+            });
+            var table = component('dash_bootstrap_components/_components', 'Table',
+                                  {children: [header, html('Tbody', rows)], bordered: false});
+
+            return [html('H5', 'ASEAN Daily Standings (' + data.display_dates[d] + ')'),
+                    html('P', data.table_note, {className: 'display-7'}),
+                    table];
+        }
+
+        function renderBubble(d, data) {
+            var counts = data.counts[d];
+            var rates = data.rates[d];
+            var layout = Object.assign({}, data.bubble_layout,
+                                       {title: {text: 'COVID-19 Bubble Plot (' + data.display_dates[d] + ')'}});
+
+            return {data: [{type: 'scatter',
+                            mode: 'markers+text',
+                            x: rates.map(function (rate) { return rate[1]; }),
+                            y: rates.map(function (rate) { return rate[0]; }),
+                            text: data.countries,
+                            marker: {color: data.colors,
+                                     size: counts.map(function (count) { return count[0] * 0.015; })}}],
+                    layout: layout};
+        }
+
+        return {
+            // Table children and bubble figure of a slider position, in the order of the outputs
+            updateStandings: function (dateIndex, view, data) {
+                var d = dateIndexOf(dateIndex, data);
+                return [renderTable(d, view, data), renderBubble(d, data)];
+            }
+        };
+    })()
+});
@@ -0,0 +1,199 @@
+'''
+Performance measurements of the dashboard and its data pipeline.
+Run from the repository root:
+    python benchmarks.py startup
+    python benchmarks.py store
+    python benchmarks.py callbacks
+    python benchmarks.py tables
+    python benchmarks.py workers
+'''
+import os
+import socket
+import subprocess
+import statistics
+import sys
+import time
+import timeit
+import requests
+
+def _median_seconds(code, repeat):
+    '''
+    Runs code in a fresh python process repeat times
+    Returns the median of the seconds printed by code
+    '''
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+
+    return statistics.median(timings)
+
+def measure_startup(modules=('revise_covid19', 'get_data', 'trace_figure', 'app'), repeat=5):
+    '''
+    Measures the import time of each module in a fresh interpreter.
+    Third-party libraries are imported beforehand so that only the module's own work is timed.
+    '''
+    print(f"Import time, median of {repeat} runs")
+    for module in modules:
+        code = ("import time, pandas, requests, bs4, plotly.graph_objects, dash\n"
+                "start = time.perf_counter()\n"
+                f"import {module}\n"
+                "print(time.perf_counter() - start)")
+        print(f"  {module:<16}{_median_seconds(code, repeat) * 1000:9.1f} ms")
+
+def measure_store(names=('revised', 'asean'), repeat=5):
+    '''
+    Compares the csv datasets with the columnar store:
+    load time in a fresh interpreter and memory used by the dataframe
+    '''
+    print(f"Load time (median of {repeat} runs) and memory")
+    for name in names:
+        for label, read in (('csv', f"pd.read_csv(DATASET_PATHS['{name}'])"),
+                            ('store', f"read_store('{name}')")):
+            code = ("import time, pandas as pd, pyarrow\n"
+                    "from dataset_loader import DATASET_PATHS\n"
+                    "from columnar_store import read_store\n"
+                    "start = time.perf_counter()\n"
+                    f"df = {read}\n"
+                    "elapsed = time.perf_counter() - start\n"
+                    "print(df.memory_usage(deep=True).sum())\n"
+                    "print(elapsed)")
+            seconds = _median_seconds(code, repeat)
+            memory = subprocess.run([sys.executable, '-c', code], check=True,
+                                    capture_output=True, text=True).stdout.split()[0]
+            print(f"  {name + ' ' + label:<16}{seconds * 1000:9.1f} ms{int(memory) / 1024:10.0f} KiB")
+
+def measure_callbacks(repeat=200):
+    '''
+    Measures the latency of each dashboard callback, called in this process
+    the way dash calls them on user input
+    '''
+    import app
+    calls = {'update_linefig': lambda: app.update_linefig('Malaysia', 'auto'),
+             'update_country_summary': lambda: app.update_country_summary('Malaysia'),
+             'update_asean_standings': lambda: app.update_asean_standings(50)}
+
+    print(f"Callback latency, median of {repeat} calls")
+    for name, call in calls.items():
+        call() # warm up
+        timings = timeit.repeat(call, number=1, repeat=repeat)
+        print(f"  {name:<24}{statistics.median(timings) * 1000:9.2f} ms")
+
+    # Row lookups done by the callbacks: scanning the dataframe vs the DataStore and SeriesCube indices
+    from dataset_loader import load_typed_dataset, load_data_store, load_cube
+    df, store, cube = load_typed_dataset('revised'), load_data_store('revised'), load_cube('revised')
+    lookups = {'latest row of a country': (lambda: df[(df['date'] == df.iloc[-1]['date']) & (df['country'] == 'Malaysia')],
+                                           lambda: store.latest_rows('Malaysia'),
+                                           lambda: cube.latest_rows('Malaysia')),
+               'rows of a date': (lambda: df[df['date'] == df['date'].unique()[50]],
+                                  lambda: store.date_frame(store.date_at(50)),
+                                  lambda: cube.date_frame(cube.date_at(50))),
+               'rows of a country': (lambda: df[df['country'] == 'Malaysia'],
+                                     lambda: store.country_frame('Malaysia'),
+                                     lambda: cube.country_frame('Malaysia'))}
+
+    print(f"Row lookups, median of {repeat} calls   dataframe scan   DataStore   SeriesCube")
+    for name, lookup_calls in lookups.items():
+        timings = [statistics.median(timeit.repeat(call, number=1, repeat=repeat)) * 1000 for call in lookup_calls]
+        print(f"  {name:<24}{timings[0]:14.3f} ms{timings[1]:9.3f} ms{timings[2]:10.3f} ms")
+
+def measure_tables(repeat=20):
+    '''
+    Measures the build time of the dashboard tables, their cells formatted the way
+    they are sent to the browser: the ASEAN standings of every date,
+    the latest summary of every country and the data of the clientside ASEAN slider
+    '''
+    import app
+    snapshot = app.refresher.snapshot
+    asean_store, asean_series, df_store = snapshot.asean_store, snapshot.asean_series, snapshot.df_store
+    asean_frames = [(date, asean_series.date_frame(date)) for date in asean_store.dates]
+    countries = [str(country) for country in df_store.countries]
+    builds = {f'ASEAN standings x{len(asean_frames)}': lambda: [app.build_asean_standings(date, df) for date, df in asean_frames],
+              f'country summary x{len(countries)}': lambda: [app.build_country_summary(df_store, country) for country in countries],
+              'topline': lambda: app.build_topline(df_store),
+              'ASEAN slider data': lambda: app.build_asean_client_data(asean_store, asean_series)}
+
+    print(f"Table build time, median of {repeat} runs")
+    for name, build in builds.items():
+        build() # warm up
+        timings = timeit.repeat(build, number=1, repeat=repeat)
+        print(f"  {name:<28}{statistics.median(timings) * 1000:9.2f} ms")
+
+def _memory_kb(pid):
+    '''
+    Returns the resident memory of a process in KiB, from /proc/<pid>/smaps_rollup:
+    rss - all resident pages, including the pages shared with other processes
+    pss - rss with each shared page divided by the number of processes sharing it
+    private - pages used by this process only
+    '''
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps_file:
+        for line in smaps_file:
+            key, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[key] = int(value.split()[0])
+
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+def measure_workers(workers=4, requests_count=200, boot_timeout=180):
+    '''
+    Starts the dashboard under gunicorn, as the Procfile does, once per DATASET_MEMORY mode,
+    sends requests until every worker answered some of them, then prints the memory of each worker
+    '''
+    countries = ['Philippines', 'Malaysia', 'Singapore', 'Indonesia', 'Thailand', 'Vietnam']
+    for memory in ('private', 'shared'):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        url = f'http://127.0.0.1:{port}'
+        master = subprocess.Popen(['gunicorn', '--workers', str(workers),
+                                   '--bind', f'127.0.0.1:{port}', 'app:server'],
+                                  env=dict(os.environ, DATASET_MEMORY=memory),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            # Each worker loads the app on its own, wait until all of them answer
+            answered = set()
+            deadline = time.time() + boot_timeout
+            while len(answered) < workers and time.time() < deadline:
+                if master.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited with code {master.returncode}")
+                try:
+                    answered.add(requests.get(url + '/stats/cache', timeout=30).json()['worker_pid'])
+                except requests.ConnectionError:
+                    time.sleep(0.5)
+            for i in range(requests_count):
+                country = countries[i % len(countries)]
+                requests.post(url + '/_dash-update-component', timeout=30,
+                              json={'output': 'selected-country.figure',
+                                    'inputs': [{'id': 'country-selection', 'property': 'value', 'value': country},
+                                               {'id': 'resolution-selection', 'property': 'value', 'value': 'auto'},
+                                               {'id': 'lineplot-metric', 'property': 'value', 'value': 'cumulative'},
+                                               {'id': 'selected-country', 'property': 'relayoutData', 'value': None}],
+                                    'changedPropIds': ['country-selection.value']})
+                requests.get(url + '/', timeout=30)
+
+            print(f"DATASET_MEMORY={memory}, {len(answered)} of {workers} workers up, memory in MiB")
+            print(f"  {'pid':<10}{'rss':>8}{'pss':>8}{'private':>9}")
+            totals = {'rss': 0, 'pss': 0, 'private': 0}
+            for pid in sorted(answered):
+                memory_kb = _memory_kb(pid)
+                for key in totals:
+                    totals[key] += memory_kb[key]
+                print(f"  {pid:<10}{memory_kb['rss'] / 1024:8.1f}{memory_kb['pss'] / 1024:8.1f}{memory_kb['private'] / 1024:9.1f}")
+            print(f"  {'total':<10}{totals['rss'] / 1024:8.1f}{totals['pss'] / 1024:8.1f}{totals['private'] / 1024:9.1f}")
+        finally:
+            master.terminate()
+            master.wait()
+
+BENCHMARKS = {'startup': measure_startup,
+              'store': measure_store,
+              'callbacks': measure_callbacks,
+              'tables': measure_tables,
+              'workers': measure_workers}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,100 @@
+import pandas as pd
+import os
+from number_format import format_percents
+from derived_metrics import DERIVED_METRICS
+
+# Typed copies of the csv datasets, in the Feather columnar format (requires pyarrow)
+STORE_PATHS = {'revised': 'datasets/revised_covid_19_data.feather',
+               'asean': 'datasets/asean_covid_19_data.feather'}
+
+COUNT_COLUMNS = ['confirmed','deaths','recovered','active']
+RATE_COLUMNS = ['death_rate_float','recovery_rate_float']
+COUNT_DTYPE = 'int32'
+
+def to_typed(df):
+    '''
+    Converts a revised (or ASEAN) dataframe read from csv to compact column types:
+    'date' as datetime, 'country' as categorical and the counts as 32-bit integers.
+    The derived metrics (see derived_metrics.add_derived_metrics) are kept if df has them.
+    The presentation columns 'death_rate' and 'recovery_rate' are dropped,
+    they can be computed again with add_rate_strings().
+    Returns a new pandas dataframe
+    '''
+    typed_df = pd.DataFrame({'date': pd.to_datetime(df['date'], format='%m/%d/%Y'),
+                             'country': df['country'].astype('category')})
+    for column in COUNT_COLUMNS:
+        typed_df[column] = df[column].astype(COUNT_DTYPE)
+    for column in RATE_COLUMNS:
+        typed_df[column] = df[column].astype('float64')
+    for column in DERIVED_METRICS:
+        if column in df.columns:
+            typed_df[column] = df[column].astype('float64')
+
+    # Keep the row order of the csv file
+    typed_df = typed_df[[column for column in df.columns if column in typed_df.columns]]
+
+    return typed_df.reset_index(drop=True)
+
+def to_csv_columns(typed_df):
+    '''
+    Converts a typed dataframe back to the columns of the csv datasets,
+    the derived metrics are left out
+    Returns a new pandas dataframe
+    '''
+    df = typed_df.drop(columns=[column for column in DERIVED_METRICS if column in typed_df.columns])
+    df['date'] = df['date'].dt.strftime('%m/%d/%Y')
+    df['country'] = df['country'].astype(str)
+    df[COUNT_COLUMNS] = df[COUNT_COLUMNS].astype('int64')
+
+    return add_rate_strings(df)
+
+def add_rate_strings(df):
+    '''
+    Adds the columns 'death_rate' and 'recovery_rate' as percentage strings,
+    e.g. "3.11 %", computed from the counts
+    '''
+    df['death_rate'] = format_percents((df['deaths'] / df['confirmed']) * 100)
+    df['recovery_rate'] = format_percents((df['recovered'] / df['confirmed']) * 100)
+
+    return df
+
+def write_store(df, name):
+    '''
+    Writes a revised (or ASEAN) dataframe with csv columns and derived metrics to the columnar store
+    name - str, one of the keys of STORE_PATHS
+    '''
+    path = STORE_PATHS[name]
+    to_typed(df).to_feather(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    print("Generated columnar store:", path)
+
+def read_store(name):
+    '''
+    Reads a typed dataframe from the columnar store
+    name - str, one of the keys of STORE_PATHS
+    '''
+    return pd.read_feather(STORE_PATHS[name])
+
+def export_csv(name, path):
+    '''
+    Exports a dataset of the columnar store to a csv file
+    with the same columns as the csv datasets
+    '''
+    to_csv_columns(read_store(name)).to_csv(path, index=False)
+    print("Generated csv file:", path)
+
+def rows_on_date(df, date):
+    '''
+    Returns a copy of the rows of a revised (or ASEAN) dataframe on one date
+    df - dataframe with csv columns ('date' as 'MM/DD/YYYY' strings) or compact column types
+    date - a datetime or a 'str' on this format 'MM/DD/YYYY'
+    '''
+    dates = pd.to_datetime(df['date'], format='%m/%d/%Y')
+
+    return df[dates == pd.Timestamp(date)].copy()
+
+def format_date(date, date_format='%m/%d/%Y'):
+    '''
+    Formats a date of the store (datetime64, Timestamp or 'MM/DD/YYYY' string) for display
+    '''
+    return pd.Timestamp(date).strftime(date_format)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import json
+
+# Aliases and excluded names of the countries found in the JHU daily reports
+COUNTRY_NAMES_PATH = 'datasets/country_names.json'
+
+class CountryRegistry:
+    '''
+    Maps the country names of the daily reports to a single canonical name.
+    aliases - dictionary of {name in the reports: canonical name}
+    excluded - list of canonical names whose rows are dropped
+               (provinces reported as countries, 'Others', ...)
+    Names are resolved once per distinct label, so the cost does not grow with the number of rows.
+    '''
+    def __init__(self, aliases=None, excluded=()):
+        self.aliases = dict(aliases or {})
+        self.excluded = set(excluded)
+
+    @classmethod
+    def from_file(cls, path=COUNTRY_NAMES_PATH):
+        '''
+        Reads the registry from a json file with the keys 'aliases' and 'excluded'
+        '''
+        with open(path) as names_file:
+            names = json.load(names_file)
+
+        return cls(names.get('aliases'), names.get('excluded', ()))
+
+    def canonical_name(self, name):
+        '''
+        Returns the canonical name of a country, or None if it is excluded
+        '''
+        name = self.aliases.get(name, name)
+
+        return None if name in self.excluded else name
+
+    def normalize(self, names):
+        '''
+        Returns the canonical names of a pandas series as a categorical series,
+        excluded names become NaN
+        '''
+        labels = pd.Categorical(names)
+        canonical = [self.canonical_name(name) for name in labels.categories]
+        categories = pd.unique(np.array([name for name in canonical if name is not None], dtype=object))
+
+        # New code of every old category, -1 for excluded names. The extra last
+        # entry is picked by the code -1 of missing values, which stay missing.
+        positions = {name: i for i, name in enumerate(categories)}
+        new_codes = np.array([positions.get(name, -1) for name in canonical] + [-1])
+
+        return pd.Series(pd.Categorical.from_codes(new_codes[labels.codes], categories),
+                         index=names.index, name=names.name)
+
+    def apply(self, df, column='Country/Region'):
+        '''
+        Replaces the country names of a dataframe by their canonical names
+        and drops the rows of excluded (or missing) countries
+        Returns a new pandas dataframe, the column keeps plain string values
+        '''
+        countries = self.normalize(df[column])
+        keep = countries.notna().values
+
+        df = df[keep].copy()
+        df[column] = countries[keep].astype(object)
+
+        return df
@@ -0,0 +1,153 @@
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from dataset_loader import DATASET_PATHS, load_dataset, load_data_store, load_cube, load_rollups, dataset_version
+from series_cube import CUBE_DIRS, LABELS_FILE
+from pipeline import RUN_LOG_PATH
+
+# Seconds between two checks of the dataset files by each worker
+REFRESH_INTERVAL_SECONDS = 60
+# 'shared' serves the lookups from the memory-mapped series cubes, whose pages are shared
+# by all processes through the OS page cache, 'private' loads a pandas copy of the datasets
+# (and its DataStore) in each process. The copies are loaded anyway for the datasets without a cube.
+DATASET_MEMORY = os.environ.get('DATASET_MEMORY', 'shared')
+# Held by the worker running the pipeline, so that the other workers do not run it too
+PIPELINE_LOCK_PATH = 'datasets/pipeline.lock'
+
+# Datasets served by the dashboard, all read from one version of the files.
+# A snapshot is never modified, a new one replaces it when the files change.
+# version - tuple of the modification times of the files the snapshot was read from
+# df_store, asean_store - DataStore, or the SeriesCube in the 'shared' DATASET_MEMORY
+# df_series, asean_series - SeriesCube, or the DataStore if the cube was not generated yet
+DataSnapshot = namedtuple('DataSnapshot', ['version', 'df_store', 'df_series', 'df_rollups',
+                                           'asean_store', 'asean_series', 'news_df'])
+
+def _modified_time(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def snapshot_version():
+    '''
+    Returns the version of the dataset files on disk, only their modification times are read
+    The times only grow when the pipeline rewrites the files, so a later version compares greater
+    (a missing file counts as 0).
+    '''
+    cube_times = tuple(_modified_time(os.path.join(directory, LABELS_FILE)) for directory in CUBE_DIRS.values())
+    times = (dataset_version('revised'), dataset_version('asean'), _modified_time(DATASET_PATHS['news'])) + cube_times
+
+    return tuple(0.0 if modified_time is None else modified_time for modified_time in times)
+
+def _load_store_and_series(name, memory):
+    cube = load_cube(name)
+    if memory == 'shared' and cube is not None:
+        return cube, cube
+    store = load_data_store(name)
+
+    return store, cube or store
+
+def load_snapshot(memory=DATASET_MEMORY):
+    '''
+    Reads the current dataset files into a new DataSnapshot
+    The datasets that did not change are shared with the previous snapshot (see dataset_loader).
+    memory - str, 'shared' or 'private', see DATASET_MEMORY
+    '''
+    version = snapshot_version()
+    df_store, df_series = _load_store_and_series('revised', memory)
+    asean_store, asean_series = _load_store_and_series('asean', memory)
+
+    return DataSnapshot(version=version,
+                        df_store=df_store,
+                        df_series=df_series,
+                        df_rollups=load_rollups('revised'),
+                        asean_store=asean_store,
+                        asean_series=asean_series,
+                        news_df=load_dataset('news'))
+
+class DataRefresher:
+    '''
+    Keeps the current DataSnapshot of a process up to date from a background thread.
+    Requests read refresher.snapshot once and use it until they return: a new snapshot
+    is loaded off the request path and replaces the previous one in a single assignment,
+    so a request never sees datasets of two versions.
+    Each gunicorn worker starts its own refresher (the thread does not survive --preload),
+    all of them pick up the files rewritten by the pipeline without a restart.
+    interval - seconds between two checks of the dataset files
+    pipeline_interval - seconds between two runs of pipeline.py, None if it is run
+                        by another scheduler (e.g. cron). The run is a separate process,
+                        started by a single worker at a time.
+    '''
+    def __init__(self, interval=REFRESH_INTERVAL_SECONDS, pipeline_interval=None):
+        self.interval = interval
+        self.pipeline_interval = pipeline_interval
+        self.snapshot = load_snapshot()
+        self._listeners = []
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def add_listener(self, function):
+        '''
+        Calls function with the new snapshot after every swap, e.g. to clear a cache
+        '''
+        self._listeners.append(function)
+
+    def refresh(self):
+        '''
+        Loads a new snapshot if the dataset files changed since the current one was loaded
+        Returns True if the snapshot was replaced
+        '''
+        if snapshot_version() == self.snapshot.version:
+            return False
+        snapshot = load_snapshot()
+        # The pipeline rewrites the files one after the other, wait until they stopped changing
+        if snapshot_version() != snapshot.version:
+            return False
+
+        self.snapshot = snapshot
+        print(f"Data snapshot replaced, version {snapshot.version}")
+        for function in self._listeners:
+            function(snapshot)
+
+        return True
+
+    def _pipeline_due(self):
+        last_run = _modified_time(RUN_LOG_PATH)
+        return last_run is None or time.time() - last_run >= self.pipeline_interval
+
+    def run_pipeline_if_due(self):
+        '''
+        Runs pipeline.py in a child process if pipeline_interval elapsed since its last run
+        and no other worker is running it
+        '''
+        if self.pipeline_interval is None or not self._pipeline_due():
+            return
+        with open(PIPELINE_LOCK_PATH, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            # Another worker may have completed a run before the lock was taken
+            if self._pipeline_due():
+                subprocess.run([sys.executable, 'pipeline.py'])
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_pipeline_if_due()
+                self.refresh()
+            except Exception as exc:
+                # The current snapshot keeps being served, the next check tries again
+                print("Data refresh failed:", repr(exc))
+
+    def start(self):
+        '''
+        Starts checking the dataset files every interval seconds in a daemon thread
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='data-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+class DataStore:
+    '''
+    Position indices over a typed revised (or ASEAN) dataframe, built once per data version
+    (see dataset_loader.load_data_store) so that the callbacks look rows up
+    instead of comparing whole columns on every request.
+    df - dataframe with compact column types, see columnar_store.to_typed
+    '''
+    def __init__(self, df):
+        self.df = df
+        self.dates = pd.DatetimeIndex(np.sort(df['date'].unique()))
+        self.countries = list(df['country'].unique())
+
+        date_groups = df.groupby('date', sort=False).indices
+        country_groups = df.groupby(df['country'].astype(str), sort=False).indices
+        self._date_positions = {pd.Timestamp(date): positions for date, positions in date_groups.items()}
+        self._country_positions = country_groups
+
+        self.latest_date = self.dates[-1]
+        self.latest = self.date_frame(self.latest_date)
+        self._latest_positions = {str(country): i for i, country in enumerate(self.latest['country'])}
+
+    def date_at(self, date_index):
+        '''
+        Returns the date at a position of the sorted unique dates, as the slider counts them
+        '''
+        return self.dates[date_index]
+
+    def country_frame(self, country):
+        '''
+        Returns the rows of one country in the order of the dataframe
+        An unknown country returns an empty dataframe.
+        '''
+        positions = self._country_positions.get(country, [])
+
+        return self.df.iloc[positions].reset_index(drop=True)
+
+    def country_matrix(self, countries, metric):
+        '''
+        Returns one metric of several countries as a dataframe of dates x countries
+        Unknown countries are left out.
+        '''
+        countries = [country for country in countries if country in self._country_positions]
+        positions = np.concatenate([self._country_positions[country] for country in countries] + [np.array([], dtype=int)])
+        rows = self.df.iloc[positions]
+        matrix = pd.DataFrame({'date': rows['date'].values,
+                               'country': rows['country'].astype(str).values,
+                               metric: rows[metric].values}).pivot(index='date', columns='country', values=metric)
+
+        return matrix.reindex(index=self.dates, columns=countries)
+
+    def date_frame(self, date):
+        '''
+        Returns the rows of one date in the order of the dataframe
+        date - a datetime or a 'str' on this format 'MM/DD/YYYY'
+        An unknown date returns an empty dataframe.
+        '''
+        positions = self._date_positions.get(pd.Timestamp(date), [])
+
+        return self.df.iloc[positions].reset_index(drop=True)
+
+    def latest_rows(self, country):
+        '''
+        Returns the row of a country on the latest date as a one-row dataframe
+        '''
+        position = self._latest_positions.get(country)
+
+        return self.latest.iloc[:0] if position is None else self.latest.iloc[[position]]
@@ -0,0 +1,140 @@
+import pandas as pd
+import os
+import shutil
+import threading
+from columnar_store import STORE_PATHS, read_store, to_typed
+from series_cube import CUBE_DIRS, LABELS_FILE, ROLLUP_FREQUENCIES, SeriesCube
+from data_store import DataStore
+from derived_metrics import add_derived_metrics
+
+# Datasets generated by revise_covid19.py and ytnews_scraper.py
+DATASET_PATHS = {'raw': 'datasets/covid_19_data.csv',
+                 'revised': 'datasets/revised_covid_19_data.csv',
+                 'asean': 'datasets/asean_covid_19_data.csv',
+                 'news': 'datasets/news.csv'}
+
+# Keyword arguments passed to pd.read_csv for each dataset
+_READ_OPTIONS = {'raw': {'index_col': 0}}
+
+_loaded = {}    # name -> (modification time, dataframe)
+_lock = threading.Lock()
+
+def load_dataset(name, copy=False):
+    '''
+    Reads a dataset on first use and keeps it in memory for the next calls.
+    The file is read again only if it was modified since it was loaded.
+    name - str, one of the keys of DATASET_PATHS
+    copy - bool, returns a copy that the caller is free to modify
+    Returns a pandas dataframe
+    '''
+    path = DATASET_PATHS[name]
+    modified_time = os.path.getmtime(path)
+
+    with _lock:
+        cached = _loaded.get(name)
+        if cached is None or cached[0] != modified_time:
+            df = pd.read_csv(path, **_READ_OPTIONS.get(name, {}))
+            cached = _loaded[name] = (modified_time, df)
+
+    return cached[1].copy() if copy else cached[1]
+
+def _typed_modified_time(name):
+    store_path = STORE_PATHS[name]
+    if os.path.exists(store_path):
+        return os.path.getmtime(store_path), True
+
+    return os.path.getmtime(DATASET_PATHS[name]), False
+
+def load_typed_dataset(name):
+    '''
+    Same as load_dataset(), but returns the dataset with compact column types
+    (see columnar_store.to_typed), read from the columnar store if it exists.
+    The pipeline writes the store after each csv, so both hold the same data.
+    The derived metrics are stored with the data, they are only computed here
+    when the store was not generated yet.
+    The returned dataframe is shared and must not be modified.
+    name - str, one of the keys of STORE_PATHS
+    '''
+    modified_time, use_store = _typed_modified_time(name)
+
+    with _lock:
+        cached = _loaded.get(('typed', name))
+        if cached is None or cached[0] != modified_time:
+            df = read_store(name) if use_store else add_derived_metrics(to_typed(pd.read_csv(DATASET_PATHS[name])))
+            cached = _loaded[('typed', name)] = (modified_time, df)
+
+    return cached[1]
+
+def dataset_version(name):
+    '''
+    Returns the version of a typed dataset, the modification time of the file it is read from.
+    It changes every time the pipeline rewrites the dataset.
+    '''
+    return _typed_modified_time(name)[0]
+
+def load_data_store(name):
+    '''
+    Returns the DataStore (position indices) of a typed dataset,
+    built once per version of the dataset
+    name - str, one of the keys of STORE_PATHS
+    '''
+    df = load_typed_dataset(name)
+    modified_time = _typed_modified_time(name)[0]
+
+    with _lock:
+        cached = _loaded.get(('data store', name))
+        if cached is None or cached[0] != modified_time:
+            cached = _loaded[('data store', name)] = (modified_time, DataStore(df))
+
+    return cached[1]
+
+def load_cube(name):
+    '''
+    Opens the memory-mapped series cube of a dataset (see series_cube.py)
+    and keeps it open for the next calls.
+    The cube is opened again only if it was rewritten since it was opened.
+    name - str, one of the keys of CUBE_DIRS
+    Returns a SeriesCube, or None if the cube was not generated yet
+    '''
+    labels_path = os.path.join(CUBE_DIRS[name], LABELS_FILE)
+    if not os.path.exists(labels_path):
+        return None
+    modified_time = os.path.getmtime(labels_path)
+
+    with _lock:
+        cached = _loaded.get(('cube', name))
+        if cached is None or cached[0] != modified_time:
+            cached = _loaded[('cube', name)] = (modified_time, SeriesCube(name))
+
+    return cached[1]
+
+def load_rollups(name='revised'):
+    '''
+    Opens the weekly and monthly series cubes of a dataset
+    Returns a dictionary of {resolution: SeriesCube}, without the cubes not generated yet
+    '''
+    rollups = {resolution: load_cube(f'{name}_{resolution}') for resolution in ROLLUP_FREQUENCIES}
+
+    return {resolution: cube for resolution, cube in rollups.items() if cube is not None}
+
+def write_csv_atomic(df, path, append=False, **to_csv_options):
+    '''
+    Writes a dataframe to a csv file through a temporary file that is renamed over path,
+    so readers never see a half-written file
+    append - bool, adds the rows (without header) after the current content of path
+    to_csv_options - keyword arguments passed to df.to_csv
+    '''
+    temp_path = path + '.tmp'
+    if append:
+        shutil.copyfile(path, temp_path)
+        df.to_csv(temp_path, mode='a', header=False, **to_csv_options)
+    else:
+        df.to_csv(temp_path, **to_csv_options)
+    os.replace(temp_path, path)
+
+def clear_datasets():
+    '''
+    Forgets all loaded datasets
+    '''
+    with _lock:
+        _loaded.clear()
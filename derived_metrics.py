@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from country_registry import CountryRegistry
+
+# Population of the countries in 2020 (see datasets/covid19_EDA_Notes.ipynb)
+POPULATION_PATH = 'datasets/pop2020_estimates.csv'
+# Days covered by the rolling means and by the growth rate
+ROLLING_DAYS = 7
+
+DELTA_METRICS = ['new_confirmed','new_deaths','new_recovered']
+AVERAGE_METRICS = ['new_confirmed_avg7','new_deaths_avg7','new_recovered_avg7']
+GROWTH_METRICS = ['growth_rate','doubling_days']
+PER_MILLION_METRICS = ['confirmed_per_million','deaths_per_million']
+# Columns added by add_derived_metrics(), all float64
+DERIVED_METRICS = DELTA_METRICS + AVERAGE_METRICS + GROWTH_METRICS + PER_MILLION_METRICS
+
+def load_population(path=POPULATION_PATH, registry=None):
+    '''
+    Reads the population table and joins its country names to the ones of the datasets
+    through the aliases of the CountryRegistry (e.g. 'East Timor' -> 'Timor-Leste')
+    registry - CountryRegistry, read from 'datasets/country_names.json' if not given
+    Returns a pandas series of the population indexed by country
+    '''
+    registry = registry or CountryRegistry.from_file()
+    pop_df = pd.read_csv(path)
+    countries = [registry.canonical_name(name) for name in pop_df['Country (or dependency)']]
+
+    # Excluded names (None) are dropped, aliases of the same country are added up
+    return pop_df['Population (2020)'].groupby(countries).sum()
+
+def add_derived_metrics(df, population=None):
+    '''
+    Adds the DERIVED_METRICS columns to a revised (or ASEAN) dataframe, computed from
+    the cumulative counts in a single vectorized pass over the rows sorted by country and date:
+    - DELTA_METRICS, new cases since the previous date (the first date of a country counts all its cases)
+    - AVERAGE_METRICS, means of the new cases over the last ROLLING_DAYS days
+    - 'growth_rate', mean daily growth of the confirmed cases over the last ROLLING_DAYS days,
+      'doubling_days', days for the confirmed cases to double at that rate (NaN without growth)
+    - PER_MILLION_METRICS, cumulative counts per million people (NaN without population)
+    df - dataframe, one row per (date, country) in any order,
+         'date' as datetimes or strings on this format 'MM/DD/YYYY'
+    population - pandas series indexed by country, read with load_population() if not given
+    Returns df with the added columns
+    '''
+    if population is None:
+        population = load_population()
+
+    dates = pd.to_datetime(df['date'], format='%m/%d/%Y').values
+    countries = df['country'].astype(str).values
+    country_codes = pd.factorize(countries)[0]
+    order = np.lexsort((dates, country_codes))
+
+    # Positions in the sorted rows, and position of the first date of each row's country
+    positions = np.arange(len(order))
+    codes = country_codes[order]
+    is_first = np.r_[True, codes[1:] != codes[:-1]] if len(order) else np.zeros(0, dtype=bool)
+    starts = np.maximum.accumulate(np.where(is_first, positions, 0))
+
+    counts = df[['confirmed','deaths','recovered']].to_numpy('float64')[order]
+    previous = np.where(is_first[:, None], 0, np.roll(counts, 1, axis=0))
+    deltas = counts - previous
+
+    # The deltas of a country add up to its counts, so a rolling sum is a difference of counts
+    window_starts = np.maximum(positions - ROLLING_DAYS, starts)
+    window_counts = np.where((positions - ROLLING_DAYS >= starts)[:, None], counts[window_starts], 0)
+    window_days = np.minimum(positions - starts + 1, ROLLING_DAYS)
+    averages = (counts - window_counts) / window_days[:, None]
+
+    confirmed = counts[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth_rate = (confirmed / confirmed[window_starts]) ** (1 / (positions - window_starts)) - 1
+        growth_rate[~np.isfinite(growth_rate) | (positions == window_starts)] = np.nan
+        doubling_days = np.where(growth_rate > 0, np.log(2) / np.log1p(growth_rate), np.nan)
+
+    country_population = pd.Series(countries[order]).map(population).to_numpy('float64')
+    per_million = counts[:, :2] / country_population[:, None] * 1e6
+
+    derived = np.column_stack([deltas, averages, growth_rate, doubling_days, per_million])
+    # Back to the row order of df
+    derived[order] = derived.copy()
+    for k, metric in enumerate(DERIVED_METRICS):
+        df[metric] = derived[:, k]
+
+    return df
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+def lttb_indices(x, y, threshold):
+    '''
+    Picks the points of a series to draw with the Largest-Triangle-Three-Buckets algorithm
+    (S. Steinarsson, 2013): the first and last points are kept, the others are split
+    into threshold - 2 buckets and each bucket keeps the point forming the largest triangle
+    with the point kept in the previous bucket and the average of the next bucket.
+    Peaks and sudden changes survive, unlike with a fixed step.
+    x, y - numpy arrays of numbers of the same length, x sorted in ascending order
+    threshold - int, number of points to keep
+    Returns the sorted positions of the kept points
+    '''
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket i covers the positions edges[i] to edges[i + 1], without the first and last points
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(int) + 1
+    edges[-1] = n - 1
+
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket, the last point for the last bucket
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+
+        areas = np.abs((x[a] - average_x) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (average_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+
+    return kept
+
+def downsample_series(series, threshold):
+    '''
+    Downsamples a pandas series indexed by dates with lttb_indices()
+    Missing values are dropped first.
+    Returns a pandas series with at most threshold points
+    '''
+    series = series.dropna()
+    x = pd.DatetimeIndex(series.index).asi8.astype('float64')
+    y = series.to_numpy('float64')
+
+    return series.iloc[lttb_indices(x, y, threshold)]
@@ -0,0 +1,89 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def make_session(pool_size=8, retries=3, backoff_factor=0.5):
+    '''
+    Creates a requests session that reuses connections to the same host
+    and retries failed requests with exponential backoff.
+    pool_size - int, number of connections kept alive per host,
+                should be at least the number of fetch workers
+    retries - int, maximum number of retries per request
+    backoff_factor - float, sleeps backoff_factor * 2**(retry - 1) seconds between retries
+    Returns a requests.Session object
+    '''
+    retry = Retry(total=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+def fetch_text(url, session=None, missing_ok=False, cache=None):
+    '''
+    GET request on a single url using the given session
+    Returns the response body as text,
+    or None if missing_ok is True and the url does not exist (404)
+    If an HttpCache is given, the request is conditional and
+    http_cache.NOT_MODIFIED is returned when the cached body is still valid
+    '''
+    if cache is not None:
+        return cache.fetch(url, session, missing_ok)
+
+    print("GET request from",url)
+    res = (session or requests).get(url)
+    if missing_ok and res.status_code == 404:
+        return None
+    res.raise_for_status()
+
+    return res.text
+
+def fetch_all(urls, session=None, workers=8, missing_ok=False, cache=None):
+    '''
+    Fetches all urls concurrently through a shared session.
+    urls - list, urls to be fetched
+    session - requests.Session, created with make_session() if not given
+    workers - int, number of concurrent fetch threads
+    missing_ok - bool, if True urls that do not exist give None instead of an error
+    cache - HttpCache, makes the requests conditional (see fetch_text)
+    Returns a list of response bodies in the same order as urls
+    '''
+    if session is None:
+        session = make_session(pool_size=workers)
+
+    if workers <= 1:
+        return [fetch_text(url, session, missing_ok, cache) for url in urls]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda url: fetch_text(url, session, missing_ok, cache), urls))
+
+def parse_all(parse_func, *iterables, processes=None, executor=None):
+    '''
+    Applies parse_func on the fetched pages using a process pool,
+    since parsing html and csv text is CPU-bound.
+    parse_func - function, must be defined at module level so it can be pickled
+    iterables - lists of arguments passed to parse_func, as in map()
+    processes - int, number of worker processes, defaults to the number of CPUs
+                parsing is done in this process if set to 1
+    executor - ProcessPoolExecutor, reused instead of starting a new pool,
+               useful when parsing in chunks
+    Returns a list of the parsed results in the same order as the inputs
+    '''
+    if executor is not None:
+        return list(executor.map(parse_func, *iterables))
+
+    if processes == 1:
+        return list(map(parse_func, *iterables))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(parse_func, *iterables))
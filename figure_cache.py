@@ -0,0 +1,85 @@
+import json
+import threading
+from collections import OrderedDict
+from plotly.utils import PlotlyJSONEncoder
+
+FIGURE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+class FigureCache:
+    '''
+    In-memory cache of built figures, keyed by their inputs
+    (e.g. country and resolution) and the version of the data they were built from.
+    A figure is validated and serialized by plotly once, then kept as a dictionary of plain
+    lists and numbers that dash encodes again without any plotly or numpy conversion.
+    The returned dictionaries are shared between requests and must not be modified.
+    Versions are ordered (e.g. tuples of modification times): a newer version drops all
+    entries, while the figures of an older version (a request that started before the data
+    was replaced) are built but not cached.
+    Entries are evicted least recently used first once the cache exceeds max_bytes.
+    Counters can be read with stats().
+    '''
+    def __init__(self, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.entries = OrderedDict()    # key -> (figure dictionary, size of its json)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def get(self, key, version, build_figure):
+        '''
+        Returns the figure of key as a dictionary
+        version - version of the data, a newer version invalidates all entries
+        build_figure - function called without arguments on a miss, returns a plotly figure
+        '''
+        with self._lock:
+            if self.version is None or version > self.version:
+                self._clear()
+                self.version = version
+            entry = self.entries.get(key) if version == self.version else None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Built outside of the lock, two requests may build the same figure once each
+        figure_json = json.dumps(build_figure(), cls=PlotlyJSONEncoder)
+        figure = json.loads(figure_json)
+        figure_size = len(figure_json)
+
+        with self._lock:
+            if version == self.version and key not in self.entries:
+                self.entries[key] = (figure, figure_size)
+                self.size += figure_size
+                while self.size > self.max_bytes and len(self.entries) > 1:
+                    self.size -= self.entries.popitem(last=False)[1][1]
+                    self.evictions += 1
+
+        return figure
+
+    def clear(self):
+        '''
+        Forgets all figures
+        '''
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        '''
+        Returns a dictionary of the cache counters
+        '''
+        with self._lock:
+            requests_count = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': round(self.hits / requests_count, 4) if requests_count else 0.0,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.size}
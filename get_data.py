@@ -1,6 +1,8 @@
 import requests
 import json
 import pandas as pd
+from dataset_loader import load_dataset, load_data_store, load_cube
+from columnar_store import add_rate_strings, rows_on_date
 
 def get_PH_topline_data():
     '''
@@ -59,7 +61,7 @@ def get_PH_hospital_data():
 
 # GET GLOBAL DATA
 def get_global_data():
-    df = pd.read_csv('datasets/revised_covid_19_data.csv')
+    df = load_dataset('revised')
     latest_date = df['date'].unique()[-1]
     print(f'Global Data updated last {latest_date}')
 
@@ -78,19 +80,29 @@ def get_top20_summarydf(df,date):
 
     return df_top20
 
-def get_asean_dailydf(date,df=pd.read_csv('datasets/asean_covid_19_data.csv')):
+def get_asean_dailydf(date,df=None,sort_by='confirmed'):
     '''
     Returns a dataframe containing COVID-19 Data of ASEAN Countries
     on a chosen date
     Important Note: Make sure datasets are updated by running
     'revise_covid19.py'.
     Only two parameter
-    date - 'str', date on this format 'MM/DD/YYYY'
-    df - dataframe, filtered covid-19 dataset containing only ASEAN Countries
+    date - date of the dataset, a datetime or a 'str' on this format 'MM/DD/YYYY'
+    df - dataframe, filtered covid-19 dataset containing only ASEAN Countries, or its SeriesCube or DataStore.
+         The series cube of 'asean_covid_19_data.csv' is used if not given
+         (or its typed dataframe if the cube was not generated yet)
+    sort_by - str, column ranking the countries in descending order (missing values last)
+    The columns 'death_rate' and 'recovery_rate' are added as percentage strings.
     '''
-
-    df_bydate = df[df['date'] == date].copy()
-    df_bydate.sort_values(by='confirmed',ascending=False,inplace=True)
+    if df is None:
+        df = load_cube('asean') or load_data_store('asean')
+
+    if isinstance(df, pd.DataFrame):
+        df_bydate = rows_on_date(df, date)
+    else:
+        df_bydate = df.date_frame(date)
+    add_rate_strings(df_bydate)
+    df_bydate.sort_values(by=sort_by,ascending=False,inplace=True,kind='mergesort') # ties keep the order of df
     df_bydate.set_index([pd.Index(range(1,len(df_bydate['country'])+1))],inplace=True)
 
     return df_bydate
@@ -0,0 +1,134 @@
+import requests
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = 'datasets/http_cache'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Returned by HttpCache.fetch() when the server answered 304 Not Modified
+NOT_MODIFIED = object()
+
+class HttpCache:
+    '''
+    Persistent on-disk cache of GET responses, keyed by url.
+    Each entry keeps the response body together with its ETag and Last-Modified
+    headers, which are sent back as If-None-Match and If-Modified-Since so that
+    unchanged pages are answered with 304 Not Modified instead of being downloaded.
+    Entries are evicted least recently used first once the cache exceeds max_bytes.
+    Counters of the current session can be read with stats().
+    '''
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.hits = 0           # 304 Not Modified, body served from disk
+        self.misses = 0         # 200 OK, body downloaded
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _body_path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def read(self, url):
+        '''
+        Returns the cached body of url as text, None if url is not cached
+        '''
+        try:
+            with open(self._body_path(url), encoding='utf-8') as body_file:
+                return body_file.read()
+        except OSError:
+            return None
+
+    def fetch(self, url, session=None, missing_ok=False):
+        '''
+        Conditional GET request on url
+        Returns NOT_MODIFIED if the cached body is still valid,
+        otherwise the new response body as text, which replaces the cached one.
+        None is returned for urls that do not exist (404) if missing_ok is True.
+        '''
+        print("GET request from",url)
+        with self._lock:
+            entry = self.index.get(url)
+
+        headers = {}
+        if entry is not None and os.path.exists(self._body_path(url)):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        res = (session or requests).get(url, headers=headers)
+        if res.status_code == 304 and headers:
+            with self._lock:
+                self.hits += 1
+                entry['last_used'] = time.time()
+            return NOT_MODIFIED
+        if missing_ok and res.status_code == 404:
+            return None
+        res.raise_for_status()
+
+        with open(self._body_path(url), 'w', encoding='utf-8') as body_file:
+            body_file.write(res.text)
+        with self._lock:
+            self.misses += 1
+            self.index[url] = {'etag': res.headers.get('ETag'),
+                               'last_modified': res.headers.get('Last-Modified'),
+                               'size': len(res.content),
+                               'last_used': time.time()}
+
+        return res.text
+
+    def get_text(self, url, session=None):
+        '''
+        Same as fetch(), but always returns the body as text,
+        reading it from the cache when the server answered 304
+        '''
+        text = self.fetch(url, session)
+        if text is NOT_MODIFIED:
+            text = self.read(url)
+
+        return text
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits in max_bytes
+        '''
+        with self._lock:
+            total_bytes = sum(entry['size'] for entry in self.index.values())
+            for url in sorted(self.index, key=lambda url: self.index[url]['last_used']):
+                if total_bytes <= self.max_bytes:
+                    break
+                total_bytes -= self.index.pop(url)['size']
+                try:
+                    os.remove(self._body_path(url))
+                except OSError:
+                    pass
+
+    def save(self):
+        '''
+        Evicts entries over the size limit and writes the index to disk
+        '''
+        self.evict()
+        with self._lock:
+            with open(self.index_path, 'w') as index_file:
+                json.dump(self.index, index_file)
+
+    def stats(self):
+        '''
+        Returns a dictionary of the cache counters of the current session
+        '''
+        requests_count = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests_count, 4) if requests_count else 0.0,
+                'entries': len(self.index),
+                'bytes': sum(entry['size'] for entry in self.index.values())}
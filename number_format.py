@@ -0,0 +1,108 @@
+import functools
+import locale
+import numpy as np
+
+# Decimals of the rate strings, e.g. "3.11 %"
+PERCENT_DECIMALS = 2
+
+@functools.lru_cache(maxsize=None)
+def locale_grouping():
+    '''
+    Reads the digit grouping of the current numeric locale once
+    Returns a tuple (thousands_sep, sizes, repeat):
+    sizes - tuple of the sizes of the groups from the right, e.g. (3,) or (3, 2)
+    repeat - bool, True if the last size is repeated for the remaining digits
+    Call locale_grouping.cache_clear() after changing the locale.
+    '''
+    conventions = locale.localeconv()
+    sizes = []
+    repeat = False
+    for size in conventions['grouping']:
+        if size == locale.CHAR_MAX: # No further grouping
+            break
+        if size == 0:               # The previous size is repeated
+            repeat = bool(sizes)
+            break
+        sizes.append(size)
+
+    return conventions['thousands_sep'], tuple(sizes), repeat
+
+@functools.lru_cache(maxsize=None)
+def locale_decimal_point():
+    '''
+    Reads the decimal point of the current numeric locale once
+    Call locale_decimal_point.cache_clear() after changing the locale.
+    '''
+    return locale.localeconv()['decimal_point']
+
+def _group_digits(digits, thousands_sep, sizes, repeat):
+    groups = []
+    end = len(digits)
+    for i in range(len(digits)):
+        if i < len(sizes):
+            size = sizes[i]
+        elif not repeat:
+            break
+        if end <= size:
+            break
+        groups.append(digits[end - size:end])
+        end -= size
+    groups.append(digits[:end])
+
+    return thousands_sep.join(reversed(groups))
+
+def format_counts(values):
+    '''
+    Formats a whole column of counts with the digit grouping of the locale,
+    the same strings as locale.format_string("%d", value, grouping=True) for each value
+    values - pandas series, numpy array or list of numbers
+    Returns a list of str
+    '''
+    counts = np.asarray(values).astype('int64')
+    thousands_sep, sizes, repeat = locale_grouping()
+    if not thousands_sep or not sizes:
+        return counts.astype(str).tolist()
+    # Groups of three digits (most locales) are inserted by the format specification
+    if repeat and set(sizes) == {3}:
+        return [format(count, ',d').replace(',', thousands_sep) for count in counts.tolist()]
+
+    return [('-' if count < 0 else '') + _group_digits(str(abs(count)), thousands_sep, sizes, repeat)
+            for count in counts.tolist()]
+
+def format_numbers(values, decimals=1, missing='-'):
+    '''
+    Formats a whole column of decimal numbers with the digit grouping of the locale,
+    the same strings as locale.format_string("%.<decimals>f", value, grouping=True) for each value
+    values - pandas series, numpy array or list of numbers
+    missing - str written for NaN and infinite values
+    Returns a list of str
+    '''
+    numbers = np.asarray(values, dtype='float64')
+    finite = np.isfinite(numbers)
+    thousands_sep, sizes, repeat = locale_grouping()
+    decimal_point = locale_decimal_point()
+
+    strings = []
+    for number, is_finite in zip(numbers.tolist(), finite.tolist()):
+        if not is_finite:
+            strings.append(missing)
+            continue
+        text = f"{number:.{decimals}f}"
+        sign = '-' if text.startswith('-') else ''
+        integer, _, fraction = text.lstrip('-').partition('.')
+        if thousands_sep and sizes:
+            integer = _group_digits(integer, thousands_sep, sizes, repeat)
+        strings.append(sign + integer + (decimal_point + fraction if fraction else ''))
+
+    return strings
+
+def format_percents(values, decimals=PERCENT_DECIMALS):
+    '''
+    Formats a whole column of percentages as strings, e.g. 3.1123 -> "3.11 %"
+    The values are rounded to decimals and written without trailing zeros ("3.1 %").
+    values - pandas series, numpy array or list of numbers, already multiplied by 100
+    Returns a list of str
+    '''
+    rounded = np.round(np.asarray(values, dtype='float64'), decimals)
+
+    return [f"{value!r} %" for value in rounded.tolist()]
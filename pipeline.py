@@ -0,0 +1,205 @@
+'''
+Runs the data pipeline that refreshes the datasets of the dashboard:
+    scrape -> clean -> filter, and news
+Run from the repository root:
+    python pipeline.py                  # all stages
+    python pipeline.py clean filter     # only these stages
+    python pipeline.py --force --full   # rerun everything from scratch
+A stage is skipped when its input files did not change since its last successful run
+and its outputs exist. Each run is appended to RUN_LOG_PATH as one json line.
+'''
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from dataset_loader import DATASET_PATHS
+from columnar_store import STORE_PATHS
+from series_cube import CUBE_DIRS, LABELS_FILE
+from country_registry import COUNTRY_NAMES_PATH
+from derived_metrics import POPULATION_PATH
+
+# Fingerprints of the inputs of each stage on its last successful run
+STATE_PATH = 'datasets/pipeline_state.json'
+RUN_LOG_PATH = 'datasets/pipeline_runs.jsonl'
+
+def _scrape(full):
+    from revise_covid19 import scrape_covid19_data
+    scrape_covid19_data(incremental=not full, refetch_days=0 if full else 3)
+
+def _clean(full):
+    from revise_covid19 import clean_covid19_data
+    clean_covid19_data(incremental=not full)
+
+def _filter(full):
+    from revise_covid19 import filter_asean_data
+    filter_asean_data(incremental=not full)
+
+def _news(full):
+    from ytnews_scraper import get_all_latestnews
+    get_all_latestnews()
+
+# Stages in dependency order.
+# inputs - local files read by the stage, None if it reads remote data and always runs
+# after - stages that must run first when both are selected
+STAGES = {'scrape': {'run': _scrape,
+                     'inputs': None,
+                     'outputs': [DATASET_PATHS['raw']],
+                     'after': []},
+          'clean': {'run': _clean,
+                    'inputs': [DATASET_PATHS['raw'], COUNTRY_NAMES_PATH, POPULATION_PATH],
+                    'outputs': [DATASET_PATHS['revised'], STORE_PATHS['revised']] +
+                               [os.path.join(CUBE_DIRS[name], LABELS_FILE)
+                                for name in ['revised', 'revised_weekly', 'revised_monthly']],
+                    'after': ['scrape']},
+          'filter': {'run': _filter,
+                     'inputs': [STORE_PATHS['revised']],
+                     'outputs': [DATASET_PATHS['asean'], STORE_PATHS['asean'],
+                                 os.path.join(CUBE_DIRS['asean'], LABELS_FILE)],
+                     'after': ['clean']},
+          'news': {'run': _news,
+                   'inputs': None,
+                   'outputs': [DATASET_PATHS['news']],
+                   'after': []}}
+
+def _fingerprint(path):
+    '''
+    Returns the sha1 of a file content, or None if it does not exist
+    '''
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def _count_rows(paths):
+    '''
+    Returns the total number of data rows of the csv files among paths
+    '''
+    rows = 0
+    for path in paths:
+        if path.endswith('.csv') and os.path.exists(path):
+            with open(path, 'rb') as csv_file:
+                rows += sum(1 for _ in csv_file) - 1
+
+    return rows
+
+def _load_json(path, default):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+def _save_json(path, data):
+    with open(path + '.tmp', 'w') as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+def order_stages(names):
+    '''
+    Sorts the selected stage names so that every stage comes after the stages it depends on
+    '''
+    ordered = []
+    def visit(name):
+        if name in ordered:
+            return
+        for previous in STAGES[name]['after']:
+            if previous in names:
+                visit(previous)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+
+    return ordered
+
+def run_stage(name, state, force=False, full=False):
+    '''
+    Runs a single stage unless its inputs did not change since its last successful run
+    state - dictionary of {stage name: input fingerprints}, updated when the stage runs
+    Returns the record of the stage for the run log
+    '''
+    stage = STAGES[name]
+    inputs = stage['inputs']
+    fingerprints = None if inputs is None else {path: _fingerprint(path) for path in inputs}
+    record = {'stage': name}
+
+    outputs_exist = all(os.path.exists(path) for path in stage['outputs'])
+    if not force and fingerprints is not None and outputs_exist and state.get(name) == fingerprints:
+        print(f"[{name}] inputs unchanged, skipped")
+        record['status'] = 'skipped'
+        return record
+
+    print(f"[{name}] running...")
+    rows_in = _count_rows(inputs or [])
+    # Traced from a fresh start for each stage, so that the peak is the stage's own
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        stage['run'](full)
+        record['status'] = 'ok'
+    except Exception as exc:
+        record['status'] = 'failed'
+        record['error'] = repr(exc)
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - start, 3)
+        record['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    record['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    record['rows_in'] = rows_in
+    record['rows_out'] = _count_rows(stage['outputs'])
+
+    if record['status'] == 'ok' and fingerprints is not None:
+        # Fingerprints taken before the run, an input modified meanwhile is seen as changed next time
+        state[name] = fingerprints
+    print(f"[{name}] {record['status']} in {record['wall_seconds']} s")
+
+    return record
+
+def run_pipeline(names=None, force=False, full=False):
+    '''
+    Runs the selected stages (all by default) in dependency order
+    and appends the run to RUN_LOG_PATH. Stops at the first failed stage.
+    force - bool, runs the stages even if their inputs did not change
+    full - bool, rebuilds the datasets from scratch instead of updating them incrementally
+    Returns the run record
+    '''
+    state = _load_json(STATE_PATH, {})
+    run = {'started': datetime.now().isoformat(timespec='seconds'), 'force': force, 'full': full, 'stages': []}
+
+    for name in order_stages(names or list(STAGES)):
+        record = run_stage(name, state, force=force, full=full)
+        run['stages'].append(record)
+        if record['status'] == 'failed':
+            print(f"[{name}] failed: {record['error']}")
+            break
+
+    run['ok'] = all(record['status'] != 'failed' for record in run['stages'])
+    _save_json(STATE_PATH, state)
+    with open(RUN_LOG_PATH, 'a') as log_file:
+        log_file.write(json.dumps(run) + '\n')
+    print("Run log appended to", RUN_LOG_PATH)
+
+    return run
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refreshes the datasets of the dashboard')
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"stages to run, among {', '.join(STAGES)} (default: all)")
+    parser.add_argument('--force', action='store_true', help='run stages even if their inputs did not change')
+    parser.add_argument('--full', action='store_true', help='rebuild the datasets instead of updating them')
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage: {', '.join(unknown)}")
+
+    run = run_pipeline(args.stages, force=args.force, full=args.full)
+    sys.exit(0 if run['ok'] else 1)
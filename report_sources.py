@@ -0,0 +1,152 @@
+import pandas as pd
+from bs4 import BeautifulSoup
+from datetime import datetime
+import io
+import os
+from fetch_reports import fetch_text, fetch_all
+
+# GitHub page listing the csv files of daily reports (rendered html)
+DAILY_REPORTS_URL = "https://github.com/CSSEGISandData/COVID-19/tree/master/csse_covid_19_data/csse_covid_19_daily_reports"
+# Same directory served as plain csv files
+RAW_REPORTS_URL = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_daily_reports"
+FIRST_REPORT_DATE = '01-22-2020'
+
+# Only these columns are read from the raw csv files.
+# Country column was renamed from 'Country/Region' to 'Country_Region' on 03/22/2020
+REPORT_COLUMNS = ['Country/Region','Confirmed','Deaths','Recovered']
+_CSV_USECOLS = {'Country/Region','Country_Region','Confirmed','Deaths','Recovered'}
+_CSV_DTYPES = {'Country/Region': str,
+               'Country_Region': str,
+               'Confirmed': 'float64',
+               'Deaths': 'float64',
+               'Recovered': 'float64'}
+
+def group_report(df, report_url, registry=None):
+    '''
+    Sums a single daily report by country
+    df - dataframe, province-level rows of one daily report
+    report_url - str, link or path of the report, its filename is the report date
+    registry - CountryRegistry, if given the country names are made canonical
+               (and excluded countries dropped) before grouping
+    Returns a dataframe with the columns
+    'ObservationDate', 'Country/Region', 'Confirmed', 'Deaths', 'Recovered'
+    '''
+    # Rename column 'Country_Region' to 'Country/Region'
+    df = df.rename(columns={'Country_Region':'Country/Region'})
+    if registry is not None:
+        df = registry.apply(df, 'Country/Region')
+
+    # Fill 'nan' with 0, only on the counts that are summed
+    counts = df[REPORT_COLUMNS].fillna(value=0)
+
+    # Group DataFrame by 'Country/Region'
+    df_bycountry = counts.groupby('Country/Region').sum()
+    df_bycountry.reset_index(inplace=True) # Reset index
+
+    # Add additional column
+    df_bycountry.insert(0, 'ObservationDate', '/'.join(report_url[-14:-4].split('-')))
+
+    return df_bycountry
+
+def parse_html_report(page_html, csvpage_url, registry=None):
+    '''
+    Reads the table content of a single csv page rendered by GitHub
+    to transform and return as a pandas dataframe
+    '''
+    # Create a Beautiful Soup object: soup
+    soup = BeautifulSoup(page_html,'lxml')
+
+    # Read html string and generate a pandas dataframe
+    df = pd.read_html(str(soup.table))[0]
+
+    return group_report(df, csvpage_url, registry)
+
+def parse_csv_report(csv_text, csv_url, registry=None):
+    '''
+    Reads a single raw csv daily report, keeping only the needed columns
+    to transform and return as a pandas dataframe
+    '''
+    df = pd.read_csv(io.StringIO(csv_text),
+                     usecols=lambda column: column in _CSV_USECOLS,
+                     dtype=_CSV_DTYPES)
+
+    return group_report(df, csv_url, registry)
+
+class HtmlReportSource:
+    '''
+    Daily reports scraped from the html pages of the GitHub tree view.
+    Kept as a fallback for RawCsvReportSource.
+    '''
+    parse = staticmethod(parse_html_report)
+
+    def __init__(self, url=DAILY_REPORTS_URL):
+        self.url = url
+
+    def list_reports(self, session=None, cache=None):
+        '''
+        Fetches all links to csv pages of daily reports
+        and returns it as a list
+        '''
+        if cache is not None:
+            page_html = cache.get_text(self.url, session)
+        else:
+            page_html = fetch_text(self.url, session)
+
+        # Create a Beautiful Soup object: soup
+        soup = BeautifulSoup(page_html,'lxml')
+
+        # Get table rows containing links to csv files
+        table_rows = soup.table.tbody.find_all('tr', class_="js-navigation-item")[1:-1]
+
+        # Set url prefix for the csv file links
+        href_prefix = 'https://github.com'
+
+        return [href_prefix + table_rows[i].span.a.get('href') for i in range(len(table_rows))]
+
+    def fetch_reports(self, links, session=None, workers=8, cache=None):
+        return fetch_all(links, session=session, workers=workers, cache=cache)
+
+class RawCsvReportSource:
+    '''
+    Daily reports read as plain csv files, either from a base url
+    (raw.githubusercontent.com by default) or from a local mirror directory
+    of the 'csse_covid_19_daily_reports' folder.
+    '''
+    parse = staticmethod(parse_csv_report)
+
+    def __init__(self, base=RAW_REPORTS_URL, end_date=None):
+        '''
+        base - str, base url or path to a local directory of 'MM-DD-YYYY.csv' files
+        end_date - str, last report date to look for on a base url, on this
+                   format 'MM-DD-YYYY', defaults to today
+        '''
+        self.base = base.rstrip('/')
+        self.end_date = end_date
+        self.is_local = os.path.isdir(base)
+
+    def list_reports(self, session=None, cache=None):
+        '''
+        Returns the links (or file paths) of all daily reports.
+        A base url cannot be listed, so one link per day is generated
+        and reports that do not exist are skipped when fetched.
+        '''
+        if self.is_local:
+            filenames = [name for name in os.listdir(self.base) if name.endswith('.csv')]
+            filenames.sort(key=lambda name: datetime.strptime(name[-14:-4], '%m-%d-%Y'))
+            return [os.path.join(self.base, name) for name in filenames]
+
+        end_date = self.end_date or datetime.utcnow().strftime('%m-%d-%Y')
+        report_dates = pd.date_range(pd.to_datetime(FIRST_REPORT_DATE, format='%m-%d-%Y'),
+                                     pd.to_datetime(end_date, format='%m-%d-%Y'))
+
+        return [f"{self.base}/{date.strftime('%m-%d-%Y')}.csv" for date in report_dates]
+
+    def fetch_reports(self, links, session=None, workers=8, cache=None):
+        if self.is_local:
+            texts = []
+            for path in links:
+                with open(path, encoding='utf-8-sig') as csv_file:
+                    texts.append(csv_file.read())
+            return texts
+
+        return fetch_all(links, session=session, workers=workers, missing_ok=True, cache=cache)
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+import flask
+
+try:
+    import brotli
+except ImportError: # Optional, the responses are only gzipped without it
+    brotli = None
+
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Dash endpoints whose response only depends on the request and on the data version
+CACHED_PATHS = ('/_dash-layout', '/_dash-update-component')
+# Methods whose request can be conditional, the layout is fetched with GET
+# while the callbacks are POST requests (If-None-Match on them asks for 412, not 304)
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+# Compression levels, each body is compressed once per data version
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+class ResponseCache:
+    '''
+    Response layer of the Flask server for the dash endpoints of CACHED_PATHS.
+    Their response is fully determined by the path, the request body (callback and inputs)
+    and the data version, so its strong ETag is known before the callback runs:
+    - a GET or HEAD request whose If-None-Match holds the ETag is answered 304 Not Modified,
+    - a request already answered for this data version is served from memory,
+      with the body compressed once (brotli if installed, or gzip) as the client accepts.
+    All entries are dropped when the data version changes.
+    Entries are evicted least recently used first once the cache exceeds max_bytes.
+    server - flask app of the dashboard
+    version - function called without arguments, returns the current data version
+    '''
+    def __init__(self, server, version, paths=CACHED_PATHS, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.version = version
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.data_version = None
+        self.entries = OrderedDict()    # key -> {encoding: body, 'mimetype': str}
+        self.size = 0
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+
+    def _key(self, version):
+        request = flask.request
+        digest = hashlib.sha1(request.path.encode('utf-8'))
+        digest.update(request.get_data())   # kept by flask for the view
+        digest.update(repr(version).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def _entry_size(self, entry):
+        return sum(len(body) for name, body in entry.items() if name != 'mimetype')
+
+    def _encoding(self):
+        '''
+        Returns the content-coding sent to the client: 'br', 'gzip' or 'identity'
+        '''
+        accepted = flask.request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+
+        return 'identity'
+
+    def _response(self, key, entry, encoding):
+        response = flask.Response(entry[encoding], mimetype=entry['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        self._set_validators(response, key, encoding)
+
+        return response
+
+    def _set_validators(self, response, key, encoding):
+        # A strong ETag stands for the exact bytes sent, so each content-coding has its own
+        response.set_etag(key if encoding == 'identity' else f'{key}-{encoding}')
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Shared caches may keep the response, but have to revalidate it on every use
+        response.headers['Cache-Control'] = 'public, no-cache'
+
+    def _before_request(self):
+        if flask.request.path not in self.paths:
+            return None
+        version = self.version()
+        key = self._key(version)
+        encoding = self._encoding()
+
+        etag = key if encoding == 'identity' else f'{key}-{encoding}'
+        if flask.request.method in CONDITIONAL_METHODS and flask.request.if_none_match.contains(etag):
+            with self._lock:
+                self.not_modified += 1
+            response = flask.Response(status=304)
+            self._set_validators(response, key, encoding)
+            return response
+
+        with self._lock:
+            if version != self.data_version:
+                self.entries.clear()
+                self.size = 0
+                self.data_version = version
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                # Stored by _after_request once the view answered
+                flask.g.response_cache = (key, version, encoding)
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return self._response(key, entry, encoding)
+
+    def _after_request(self, response):
+        cached = flask.g.pop('response_cache', None)
+        if cached is None or response.status_code != 200 or response.direct_passthrough:
+            return response
+        key, version, encoding = cached
+        # The data was replaced while the view ran, the body may belong to either version
+        if self.version() != version:
+            return response
+
+        body = response.get_data()
+        entry = {'identity': body,
+                 'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+                 'mimetype': response.mimetype}
+        if brotli is not None:
+            entry['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+        with self._lock:
+            if version == self.data_version and key not in self.entries:
+                self.entries[key] = entry
+                self.size += self._entry_size(entry)
+                while self.size > self.max_bytes and len(self.entries) > 1:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= self._entry_size(evicted)
+                    self.evictions += 1
+
+        return self._response(key, entry, encoding)
+
+    def stats(self):
+        '''
+        Returns a dictionary of the cache counters
+        '''
+        with self._lock:
+            requests_count = self.hits + self.not_modified + self.misses
+            return {'hits': self.hits,
+                    'not_modified': self.not_modified,
+                    'misses': self.misses,
+                    'hit_rate': round((self.hits + self.not_modified) / requests_count, 4) if requests_count else 0.0,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.size,
+                    'brotli': brotli is not None}
@@ -1,135 +1,403 @@
 import pandas as pd
-from bs4 import BeautifulSoup
-import requests
+import io
+import json
+import os
+import shutil
+import zlib
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from fetch_reports import make_session, parse_all
+from report_sources import RawCsvReportSource
+from http_cache import HttpCache, NOT_MODIFIED
+from dataset_loader import load_dataset, load_typed_dataset, write_csv_atomic, DATASET_PATHS
+from columnar_store import add_rate_strings, to_csv_columns, to_typed, read_store, write_store, STORE_PATHS
+from series_cube import append_cube, append_rollups, write_cube, write_rollups
+from country_registry import CountryRegistry, COUNTRY_NAMES_PATH
+from derived_metrics import add_derived_metrics, POPULATION_PATH, ROLLING_DAYS
 
-def scrape_covid19_data():
+RAW_DATA_PATH = DATASET_PATHS['raw']
+REVISED_DATA_PATH = DATASET_PATHS['revised']
+ASEAN_DATA_PATH = DATASET_PATHS['asean']
+
+# ASEAN Countries
+ASEAN_COUNTRIES = ['Indonesia','Thailand','Singapore','Malaysia','Philippines',
+                   'Vietnam','Cambodia','Laos','Brunei','Burma']
+
+def _report_date(csv_link):
+  '''
+  Returns the report date of a daily report link as a pandas Timestamp
+  Daily report files are named on this format 'MM-DD-YYYY.csv'
+  '''
+  return pd.to_datetime(csv_link[-14:-4], format='%m-%d-%Y')
+
+def _select_new_reports(csv_links, disk_dates, refetch_days=0):
+  '''
+  Compares the daily report links against the dates of the raw dataset already on disk
+  disk_dates - list of the 'ObservationDate' values on disk, on this format 'MM/DD/YYYY'
+  Returns a tuple of two items:
+    the links of reports that are newer than the latest 'ObservationDate'
+    or that fall within the last refetch_days days on disk,
+    and the dates on disk whose rows are kept (not fetched again)
+  '''
+  observation_dates = pd.to_datetime(pd.Series(disk_dates, dtype=object), format='%m/%d/%Y')
+  latest_date = observation_dates.max()
+  cutoff_date = latest_date - pd.Timedelta(days=max(refetch_days,0))
+
+  selected_links = [link for link in csv_links if _report_date(link) > cutoff_date]
+  kept_dates = [date for date, observation_date in zip(disk_dates, observation_dates) if observation_date <= cutoff_date]
+
+  return selected_links, kept_dates
+
+def get_day_report_df(csvpage_url, session=None, source=None, registry=None):
+  '''
+  Fetches a single daily report link
+  to transform and return as a pandas dataframe
+  source - report source used to read the link, defaults to RawCsvReportSource
+  registry - CountryRegistry, if given country names are made canonical before grouping
+  '''
+  source = source or RawCsvReportSource()
+  report_text = source.fetch_reports([csvpage_url], session=session, workers=1)[0]
+
+  return source.parse(report_text, csvpage_url, registry)
+
+# Types of the columns of the raw dataset, as written by report_sources.group_report()
+_RAW_DTYPES = {'ObservationDate': str, 'Country/Region': str,
+               'Confirmed': 'float64', 'Deaths': 'float64', 'Recovered': 'float64'}
+
+def _index_csv_dates(path):
+  '''
+  Scans a csv file whose first column is the date once and returns a tuple of two items:
+    its header line (bytes),
+    and a dict of the byte ranges of its rows by date {'MM/DD/YYYY': [(start, end), ...]}
+  Used on the raw dataset ('ObservationDate') and on the revised one ('date'),
+  the rows of one date are written together.
+  Only these offsets are kept in memory, the rows are read back with _read_raw_rows()
+  '''
+  date_ranges = {}
+  with open(path, 'rb') as csv_file:
+    header = csv_file.readline()
+    offset = csv_file.tell()
+    for line in csv_file:
+      ranges = date_ranges.setdefault(line[:line.index(b',')].decode(), [])
+      if ranges and ranges[-1][1] == offset:
+        ranges[-1] = (ranges[-1][0], offset + len(line))
+      else:
+        ranges.append((offset, offset + len(line)))
+      offset += len(line)
+
+  return header, date_ranges
+
+def _read_raw_rows(path, raw_index, dates):
+  '''
+  Reads only the rows of the given dates from the raw csv file
+  raw_index - tuple returned by _index_csv_dates(path)
+  Returns a dict of dataframes by date, dates missing from the file are left out
+  '''
+  header, date_ranges = raw_index
+  ranges = [byte_range for date in dates for byte_range in date_ranges.get(date, [])]
+  if not ranges:
+    return {}
+
+  with open(path, 'rb') as csv_file:
+    parts = [header]
+    for start, end in ranges:
+      csv_file.seek(start)
+      parts.append(csv_file.read(end - start))
+  rows_df = pd.read_csv(io.BytesIO(b''.join(parts)), dtype=_RAW_DTYPES)
+
+  return {date: rows for date, rows in rows_df.groupby('ObservationDate', sort=False)}
+
+def _copy_csv_rows(path, csv_index, dates, output_path, block_size=1024 * 1024):
+  '''
+  Copies the header and the rows of the given dates from a csv file to output_path,
+  in their order in the file, block_size bytes at a time
+  csv_index - tuple returned by _index_csv_dates(path)
+  '''
+  header, date_ranges = csv_index
+  ranges = sorted(byte_range for date in dates for byte_range in date_ranges.get(date, []))
+
+  with open(path, 'rb') as csv_file, open(output_path, 'wb') as output_file:
+    output_file.write(header)
+    for start, end in ranges:
+      csv_file.seek(start)
+      remaining = end - start
+      while remaining > 0:
+        block = csv_file.read(min(block_size, remaining))
+        output_file.write(block)
+        remaining -= len(block)
+
+# Checksums of the raw rows of each date and of the other inputs read by the last
+# clean_covid19_data() run, they tell which dates an incremental run has to clean again
+REVISED_MANIFEST_PATH = 'datasets/revised_covid_19_data.manifest.json'
+
+def _file_checksum(path, block_size=1024 * 1024):
+  checksum = 0
+  with open(path, 'rb') as input_file:
+    for block in iter(lambda: input_file.read(block_size), b''):
+      checksum = zlib.crc32(block, checksum)
+
+  return checksum
+
+def _date_checksums(path, csv_index):
+  '''
+  Returns the checksums of the rows of each date of a csv file {'MM/DD/YYYY': crc32}
+  csv_index - tuple returned by _index_csv_dates(path)
+  '''
+  checksums = {}
+  with open(path, 'rb') as csv_file:
+    for date, ranges in csv_index[1].items():
+      checksum = 0
+      for start, end in ranges:
+        csv_file.seek(start)
+        checksum = zlib.crc32(csv_file.read(end - start), checksum)
+      checksums[date] = checksum
+
+  return checksums
+
+def _input_checksums():
+  return {path: _file_checksum(path) for path in [COUNTRY_NAMES_PATH, POPULATION_PATH]}
+
+def _write_revised_manifest(raw_checksums, first_dates):
+  '''
+  Records the inputs of the revised dataset, once all its files have been written
+  raw_checksums - dict returned by _date_checksums() for the raw dataset
+  first_dates - dict of the first date of each country {country: 'MM/DD/YYYY'},
+                in the order of the countries in the dense grid
+  '''
+  manifest = {'raw_dates': raw_checksums,
+              'first_dates': first_dates,
+              'inputs': _input_checksums()}
+  with open(REVISED_MANIFEST_PATH + '.tmp', 'w') as manifest_file:
+    json.dump(manifest, manifest_file)
+  os.replace(REVISED_MANIFEST_PATH + '.tmp', REVISED_MANIFEST_PATH)
+
+def _read_revised_manifest():
+  '''
+  Returns the manifest of the revised dataset, None if it or one of its files is missing
+  '''
+  outputs = [REVISED_MANIFEST_PATH, REVISED_DATA_PATH, STORE_PATHS['revised']]
+  if not all(os.path.exists(path) for path in outputs):
+    return None
+  with open(REVISED_MANIFEST_PATH) as manifest_file:
+    return json.load(manifest_file)
+
+def _select_changed_dates(manifest, raw_checksums):
+  '''
+  Compares the raw dataset with the manifest of the last run of clean_covid19_data()
+  Returns the list of new or revised dates, empty if nothing changed,
+  or None if the whole dataset has to be cleaned again: dates were removed,
+  a changed date comes before an unchanged one, a country first appears on a changed date
+  (the order of the countries may change), or the country names or population estimates changed
+  '''
+  if manifest['inputs'] != _input_checksums() or not set(manifest['raw_dates']) <= set(raw_checksums):
+    return None
+  changed_dates = [date for date, checksum in raw_checksums.items()
+                   if manifest['raw_dates'].get(date) != checksum]
+  if not changed_dates:
+    return []
+
+  # The revised csv file is sorted by date strings and the cubes by dates,
+  # the changed dates have to come last in both orders
+  kept_dates = [date for date in raw_checksums if date not in set(changed_dates)]
+  from_date = min(changed_dates)
+  if kept_dates and (max(kept_dates) >= from_date or
+                     pd.to_datetime(kept_dates, format='%m/%d/%Y').max() >=
+                     pd.to_datetime(changed_dates, format='%m/%d/%Y').min()):
+    return None
+  if any(first_date >= from_date for first_date in manifest['first_dates'].values()):
+    return None
+
+  return changed_dates
+
+def _reports_to_frames(pages, csv_links, source, disk_reports, cache, executor, registry=None):
+  '''
+  Turns a chunk of fetched daily reports into per-country dataframes
+  Reports that were not modified (304) reuse their rows from disk_reports,
+  the others are parsed by the executor (or in this process if None)
+  registry - CountryRegistry, makes the country names canonical before each report is grouped
+  Returns a list of dataframes in the same order as csv_links
+  '''
+  df_dict = {}
+  parse_positions = []
+  for i in range(len(pages)):
+    if pages[i] is None: # Skip the days without a report
+      continue
+    if pages[i] is NOT_MODIFIED:
+      report_date = '/'.join(csv_links[i][-14:-4].split('-'))
+      if report_date in disk_reports:
+        df_dict[i] = disk_reports[report_date]
+        continue
+      pages[i] = cache.read(csv_links[i])
+    parse_positions.append(i)
+
+  parsed_list = parse_all(source.parse,
+                          [pages[i] for i in parse_positions],
+                          [csv_links[i] for i in parse_positions],
+                          [registry] * len(parse_positions),
+                          processes=1, executor=executor)
+  df_dict.update(zip(parse_positions, parsed_list))
+
+  return [df_dict[i] for i in sorted(df_dict)]
+
+def scrape_covid19_data(incremental=False, refetch_days=0, workers=8, processes=None, source=None,
+                        use_cache=True, chunk_size=None, registry=None):
   '''
-  Concatenates all daily reports by using these internal functions:
-    get_csv_links, get_day_report_df
-  Finally, it generates a csv file with the filename 'covid_19_data.csv'
+  Streams all daily reports read through a report source (see report_sources.py)
+  into a csv file with the filename 'covid_19_data.csv'
     This csv file is meant to be cleaned using the function revise_covid19_data()
-  Returns a pandas dataframe containing the scraped raw dataset
-  '''
-  def get_csv_links():
-    '''
-    Fetches all links to csv files of daily reports
-    and returns it as a list
-    '''
-    # URL containing list of csv files of daily reports
-    url = "https://github.com/CSSEGISandData/COVID-19/tree/master/csse_covid_19_data/csse_covid_19_daily_reports"
-
-    # Create requests object: res
-    res = requests.get(url)
-    res.raise_for_status()
-
-    # Create a Beautiful Soup object: soup
-    soup = BeautifulSoup(res.text,'lxml')
-    
-    # Get table rows containing links to csv files
-    table_rows = soup.table.tbody.find_all('tr', class_="js-navigation-item")[1:-1]
-    
-    # Set url prefix for the csv file links
-    href_prefix = 'https://github.com'
-    
-    return [href_prefix + table_rows[i].span.a.get('href') for i in range(len(table_rows))]
-
-  def get_day_report_df(csvpage_url):
-    '''
-    Scrapes the table content of a single csv page link
-    to transform and return as a pandas dataframe
-    '''
-    print("GET request from",csvpage_url)
-
-    # Create requests object: res
-    res = requests.get(csvpage_url)
-    res.raise_for_status()
-
-    # Create a Beautiful Soup object: soup
-    soup = BeautifulSoup(res.text,'lxml')
-    
-    # Read html string and generate a pandas dataframe
-    df = pd.read_html(str(soup.table))[0]
-
-    # Add additional column
-    df['ObservationDate'] = '/'.join(csvpage_url[-14:-4].split('-'))
-    
-    # Rename column 'Country_Region' to 'Country/Region'
-    df.rename(columns={'Country_Region':'Country/Region'},inplace=True)
-    
-    # Fill 'nan' with 0
-    df.fillna(value=0,inplace=True)
-    
-    # Group DataFrame by 'Country/Region'
-    df_bycountry = df.groupby(['ObservationDate','Country/Region']).sum().copy()
-    df_bycountry.reset_index(inplace=True) # Reset index    
-    df_bycountry = df_bycountry[['ObservationDate', # Reduce columns included
-                                 'Country/Region',
-                                 'Confirmed',
-                                 'Deaths',
-                                 'Recovered']]
-    
-    return df_bycountry
+  Reports are fetched, reduced to country totals and written to the file
+  one chunk at a time, so only chunk_size reports are held in memory.
+  Takes eight optional parameters
+  incremental - bool, if True only the daily reports newer than the latest
+                'ObservationDate' in 'covid_19_data.csv' are fetched and appended
+  refetch_days - int, number of most recent days already on disk to fetch again
+                 in incremental mode, since JHU revises recent reports
+  workers - int, number of concurrent downloads sharing one connection pool,
+            set to 1 to fetch the reports one after another
+  processes - int, number of processes parsing the downloaded reports,
+              defaults to the number of CPUs, set to 1 to parse in this process
+  source - RawCsvReportSource (default) reads the raw csv files from GitHub
+           or from a local mirror directory,
+           HtmlReportSource scrapes the html pages of GitHub as a fallback
+  use_cache - bool, if True reports are fetched through the on-disk HttpCache,
+              reports that did not change since the last run (304) are neither
+              downloaded nor parsed again, their rows are reused from 'covid_19_data.csv'
+  chunk_size - int, number of reports fetched and written at a time, defaults to workers
+  registry - CountryRegistry, country names are made canonical as each report is read,
+             read from 'datasets/country_names.json' if not given
+  '''
+  source = source or RawCsvReportSource()
+  registry = registry or CountryRegistry.from_file()
+  session = make_session(pool_size=workers)
+  cache = HttpCache() if use_cache else None
+  chunk_size = chunk_size or workers
+
   print("Fetching links to daily reports...")
-  csv_links = get_csv_links()
+  csv_links = source.list_reports(session=session, cache=cache)
 
-  print("Concatenating daily reports into a single dataframe...")
-  df_list = [get_day_report_df(csv_links[i]) for i in range(len(csv_links))]
+  # The raw dataset on disk only holds country totals. It is never loaded as a whole:
+  # its rows are found through the byte offsets of each date (see _index_csv_dates)
+  raw_index = _index_csv_dates(RAW_DATA_PATH) if os.path.exists(RAW_DATA_PATH) else None
+  disk_dates = list(raw_index[1]) if raw_index is not None else []
+  kept_dates = None
+  if incremental and disk_dates:
+    csv_links, kept_dates = _select_new_reports(csv_links, disk_dates, refetch_days)
+    if not csv_links:
+      print("No new daily reports since", disk_dates[-1])
+      return
+    print(f"Fetching {len(csv_links)} new or revised daily reports...")
+
+  # Rows are written to a new file next to the old one and swapped in at the end.
+  # If nothing on disk was revised, the new reports are appended to a copy of the old file,
+  # otherwise the rows of the kept dates are copied first
+  appending = kept_dates is not None and len(kept_dates) == len(disk_dates)
+  output_path = RAW_DATA_PATH + '.tmp'
+  write_mode = 'w'
+  if appending:
+    shutil.copyfile(RAW_DATA_PATH, output_path)
+    write_mode = 'a'
+  elif kept_dates is not None:
+    _copy_csv_rows(RAW_DATA_PATH, raw_index, kept_dates, output_path)
+    write_mode = 'a'
+
+  rows_written = 0
+  parse_pool = nullcontext() if processes == 1 else ProcessPoolExecutor(max_workers=processes)
+  try:
+    with parse_pool as executor:
+      for start in range(0, len(csv_links), chunk_size):
+        chunk_links = csv_links[start:start + chunk_size]
+
+        print("Downloading daily reports...")
+        pages = source.fetch_reports(chunk_links, session=session, workers=workers, cache=cache)
+        # Rows of the reports that were not modified (304) are read back from disk
+        disk_reports = {}
+        if cache is not None and raw_index is not None:
+          unmodified_dates = ['/'.join(link[-14:-4].split('-'))
+                              for link, page in zip(chunk_links, pages) if page is NOT_MODIFIED]
+          disk_reports = _read_raw_rows(RAW_DATA_PATH, raw_index, unmodified_dates)
+        df_list = _reports_to_frames(pages, chunk_links, source, disk_reports, cache, executor, registry)
+        if not df_list:
+          continue
+
+        chunk_df = pd.concat(df_list,axis=0)
+        chunk_df.to_csv(output_path,index=False,mode=write_mode,header=(write_mode == 'w'))
+        write_mode = 'a'
+        rows_written += len(chunk_df)
+  except BaseException:
+    # Leave the csv file on disk untouched
+    if os.path.exists(output_path):
+      os.remove(output_path)
+    raise
+
+  if cache is not None:
+    cache.save()
+    print("HTTP cache:", cache.stats())
+
+  if rows_written == 0:
+    print("No daily reports found")
+    if os.path.exists(output_path):
+      os.remove(output_path)
+    return
 
-  df = pd.concat(df_list,axis=0)
-  
   print("Dataframe complete!")
-  print("Generated csv file: datasets/covid_19_data.csv")
-  df.to_csv('datasets/covid_19_data.csv',index=False)
+  os.replace(output_path, RAW_DATA_PATH)
+  if appending:
+    print(f"Appended {rows_written} rows to csv file:", RAW_DATA_PATH)
+  else:
+    print("Generated csv file:", RAW_DATA_PATH)
 
-  #return df
+# Columns of the dense grid, as written to 'revised_covid_19_data.csv'
+GRID_COUNT_COLUMNS = ['confirmed','deaths','recovered','active']
+GRID_RATE_COLUMNS = ['death_rate_float','recovery_rate_float']
 
-def clean_covid19_data(df=pd.read_csv('datasets/covid_19_data.csv', index_col=0)):
+def build_dense_grid(df_bycountry, countries=None):
   '''
-  Cleans the newly scraped covid-19 data
-  need only one parameter
-  df - dataframe, This should be the output of scrape_covid19_data() function
+  Reorganizes the per-country data so that every country has a row on every date
+  df_bycountry - dataframe, grouped by 'ObservationDate' and 'Country/Region'
+                 with the added columns 'active', 'death_rate_float', 'recovery_rate_float'
+  countries - list of the countries of the grid, defaults to those of df_bycountry
+              in the order in which they first appear
+  Dates keep their order in df_bycountry.
+  Missing (date, country) pairs are filled with 0.
+  Returns a pandas dataframe with the columns 'date', 'country' + GRID_COUNT_COLUMNS + GRID_RATE_COLUMNS
+  '''
+  dates = df_bycountry['ObservationDate'].unique()
+  if countries is None:
+    countries = df_bycountry['Country/Region'].unique()
+  grid_index = pd.MultiIndex.from_product([dates, countries], names=['date','country'])
 
-  Returns a pandas dataframe containing the cleaned dataset
+  rev_df = df_bycountry.rename(columns={'ObservationDate':'date',
+                                        'Country/Region':'country',
+                                        'Confirmed':'confirmed',
+                                        'Deaths':'deaths',
+                                        'Recovered':'recovered'})
+  rev_df = rev_df.set_index(['date','country'])[GRID_COUNT_COLUMNS + GRID_RATE_COLUMNS]
+  rev_df = rev_df.reindex(grid_index, fill_value=0).reset_index()
+
+  # Counts are whole numbers stored as floats in the raw dataset
+  rev_df[GRID_COUNT_COLUMNS] = rev_df[GRID_COUNT_COLUMNS].astype('int64')
+  rev_df[GRID_RATE_COLUMNS] = rev_df[GRID_RATE_COLUMNS].astype('float64')
+
+  return rev_df
+
+def _clean_country_data(df):
+  '''
+  Applies the corrections on country names (aliases and excluded countries
+  of the CountryRegistry) and groups the raw data by
+  'ObservationDate' and 'Country/Region', then adds the columns
+  'active', 'death_rate_float' and 'recovery_rate_float'
+  df - dataframe, raw data indexed by 'ObservationDate'
+  Returns the grouped dataframe
   '''
   print('Applying corrections on country names...')
-  # Data Cleaning on Country Names
-  df.replace({' Azerbaijan':'Azerbaijan',
-              "('St. Martin',)":'Saint Martin',
-              'St. Martin':'Saint Martin',
-              'Bahamas, The':'Bahamas',
-              'Czechia':'Czech Republic',
-              'East Timor':'Timor-Leste',
-              'Hong Kong SAR':'Hong Kong',
-              'Iran (Islamic Republic of)':'Iran',
-              'Korea, South':'South Korea',
-              'Macao SAR':'Macau',
-              'Mainland China':'China',
-              'Republic of the Congo':'Congo (Brazzaville)',
-              'Russian Federation':'Russia',
-              'Republic of Korea':'South Korea',
-              'Republic of Moldova':'Moldova',
-              'Taipei and environs':'Taiwan',
-              'Taiwan*':'Taiwan',
-              'The Bahamas':'Bahamas',
-              'UK': 'United Kingdom',
-              'US': 'United States',
-              'Viet Nam': 'Vietnam',
-              'occupied Palestinian territory':'Palestine',
-              'West Bank and Gaza':'Palestine'
-              }, inplace=True)
+  # Data Cleaning on Country Names, see 'datasets/country_names.json'
+  df = CountryRegistry.from_file().apply(df, 'Country/Region')
   
   print("Temporary grouping of data by 'ObservationDate' and 'Country/Region'...")
   # Group DataFrame by 'Country/Region'
   df_bycountry = df.groupby(['ObservationDate','Country/Region']).sum().copy()
-  
-  print("Dropping invalid country data rows...")
-  # Drop countries
-  df_bycountry.reset_index(inplace=True)
-  df_bycountry.set_index('Country/Region',inplace=True)
-  df_bycountry.drop(labels=['North Ireland','Republic of Ireland','Cape Verde','Gambia, The',
-                            'The Gambia','Guernsey','Jersey','Vatican City','Others'],axis=0,inplace=True)
   df_bycountry.reset_index(inplace=True)
-
+  
   print("Adding the following columns: 'active', 'death_rate_float','recovery_rate_float...'")
   # Added columns
   df_bycountry['active'] = df_bycountry['Confirmed'] - df_bycountry['Deaths'] - df_bycountry['Recovered']
@@ -153,81 +421,182 @@ def clean_covid19_data(df=pd.read_csv('datasets/covid_19_data.csv', index_col=0)
        3    South Korea      01/22/2020        1.0     0.0        0.0     1.0          0.000000             0.000000
        4         Taiwan      01/22/2020        1.0     0.0        0.0     1.0          0.000000             0.000000
   '''
-  print("Reorganizing data in a dictioanary...")
-  data_dict = {'date':[],
-               'country':[],
-               'confirmed':[],
-               'deaths':[],
-               'recovered':[],
-               'active':[],
-               'death_rate_float':[],
-               'recovery_rate_float':[]
-              }
-
-  for date in df_bycountry['ObservationDate'].unique():
-    print("\tPopulating dictionary for this Observation Date:",date)
-    for country in df_bycountry['Country/Region'].unique():
-        print(f"\t\tFor {country}...")
-        data_dict['date'].append(date)
-        data_dict['country'].append(country)
-
-        try:
-          df_filter = (df_bycountry['ObservationDate'] == date) & (df_bycountry['Country/Region'] == country)
-          data_dict['confirmed'].append(int(df_bycountry[df_filter]['Confirmed']))
-          data_dict['deaths'].append(int(df_bycountry[df_filter]['Deaths']))
-          data_dict['recovered'].append(int(df_bycountry[df_filter]['Recovered']))
-          data_dict['active'].append(int(df_bycountry[df_filter]['active']))
-          data_dict['death_rate_float'].append(float(df_bycountry[df_filter]['death_rate_float']))
-          data_dict['recovery_rate_float'].append(float(df_bycountry[df_filter]['recovery_rate_float']))
-        except:
-          data_dict['confirmed'].append(0)
-          data_dict['deaths'].append(0)
-          data_dict['recovered'].append(0)
-          data_dict['active'].append(0)
-          data_dict['death_rate_float'].append(0)
-          data_dict['recovery_rate_float'].append(0)          
+  return df_bycountry
 
+def _clean_new_dates():
+  '''
+  Cleans only the dates of 'covid_19_data.csv' that are new or were revised since the last run
+  (see _select_changed_dates) and replaces them in the revised dataset:
+  the rows of the unchanged dates are copied from 'revised_covid_19_data.csv' and appended to,
+  the derived metrics are computed for the new rows only, with the ROLLING_DAYS dates before them,
+  and the slices of the new dates are appended to the series cubes.
+  Returns False, without writing anything, if the whole dataset has to be cleaned again
+  '''
+  manifest = _read_revised_manifest()
+  if manifest is None:
+    return False
+  raw_index = _index_csv_dates(RAW_DATA_PATH)
+  raw_checksums = _date_checksums(RAW_DATA_PATH, raw_index)
+  changed_dates = _select_changed_dates(manifest, raw_checksums)
+  if changed_dates is None:
+    return False
+  if not changed_dates:
+    print("No new or revised dates in", RAW_DATA_PATH)
+    return True
+
+  print(f"Cleaning {len(changed_dates)} new or revised dates...")
+  df = pd.concat(_read_raw_rows(RAW_DATA_PATH, raw_index, changed_dates).values())
+  df_bycountry = _clean_country_data(df.set_index('ObservationDate'))
+  countries = list(manifest['first_dates'])
+  if not set(df_bycountry['Country/Region']) <= set(countries):
+    print("New countries found, cleaning all dates again...")
+    return False
+
+  print("Reorganizing the new dates into the dense date x country grid...")
+  new_df = add_rate_strings(build_dense_grid(df_bycountry, countries=countries))
+
+  print("Computing the derived metrics of the new dates...")
+  from_date = pd.to_datetime(min(changed_dates), format='%m/%d/%Y')
+  store_df = read_store('revised')
+  store_df = store_df[(store_df['date'] < from_date).values]
+  lookback_dates = store_df['date'].drop_duplicates().nlargest(ROLLING_DAYS)
+  lookback_df = store_df[store_df['date'].isin(lookback_dates).values]
+  metrics_df = add_derived_metrics(pd.concat([lookback_df, to_typed(new_df)], ignore_index=True))
+  new_store_df = to_typed(metrics_df.iloc[len(lookback_df):])
+  store_df = pd.concat([store_df, new_store_df], ignore_index=True)
+
+  kept_dates = [date for date in raw_checksums if date not in set(changed_dates)]
+  _copy_csv_rows(REVISED_DATA_PATH, _index_csv_dates(REVISED_DATA_PATH), kept_dates, REVISED_DATA_PATH + '.tmp')
+  new_df.to_csv(REVISED_DATA_PATH + '.tmp', mode='a', header=False, index=False)
+  os.replace(REVISED_DATA_PATH + '.tmp', REVISED_DATA_PATH)
+  print(f"Appended {len(new_df)} rows to csv file:", REVISED_DATA_PATH)
+
+  # Feather files cannot be appended to, the store is written again from the typed rows
+  write_store(store_df, 'revised')
+  if not append_cube(new_store_df, 'revised', from_date):
+    write_cube(store_df, 'revised')
+  if not append_rollups(store_df, 'revised', from_date):
+    write_rollups(store_df, 'revised')
+  _write_revised_manifest(raw_checksums, manifest['first_dates'])
+
+  return True
+
+def clean_covid19_data(df=None, incremental=False):
+  '''
+  Cleans the newly scraped covid-19 data
+  Writes 'revised_covid_19_data.csv', its typed copy in the columnar store
+  and its memory-mapped series cubes (daily, weekly and monthly).
+  The store and the cubes also hold the derived metrics (daily new cases, rolling means,
+  growth and per-capita rates), computed once here for the whole grid.
+  df - dataframe, This should be the output of scrape_covid19_data() function,
+       'covid_19_data.csv' is loaded if not given
+  incremental - bool, if True and df is not given, only the dates of 'covid_19_data.csv'
+                that are new or were revised since the last run are cleaned (see _clean_new_dates),
+                all dates are cleaned again when that is not possible
+
+  Returns a pandas dataframe containing the cleaned dataset
+  '''
+  if df is None and incremental and _clean_new_dates():
+    return
+
+  # The manifest only describes datasets cleaned from 'covid_19_data.csv' as a whole
+  if os.path.exists(REVISED_MANIFEST_PATH):
+    os.remove(REVISED_MANIFEST_PATH)
+  raw_checksums = None
+  if df is None:
+    raw_checksums = _date_checksums(RAW_DATA_PATH, _index_csv_dates(RAW_DATA_PATH))
+    df = load_dataset('raw', copy=True)
+
+  df_bycountry = _clean_country_data(df)
+
+  print("Reorganizing data into a dense date x country grid...")
+  rev_df = add_rate_strings(build_dense_grid(df_bycountry))
   print("Final dataframe complete!")
-  rev_df = pd.DataFrame(data_dict)
 
-  # Added columns
-  rev_df['death_rate'] = (rev_df['deaths'] / rev_df['confirmed']) * 100
-  rev_df['death_rate'] = rev_df['death_rate'].round(2).astype(str) + " %"
-  rev_df['recovery_rate'] = (rev_df['recovered'] / rev_df['confirmed']) * 100
-  rev_df['recovery_rate'] = rev_df['recovery_rate'].round(2).astype(str) + " %"
+  write_csv_atomic(rev_df,REVISED_DATA_PATH,index=False)
+  print("Generated csv file:", REVISED_DATA_PATH)
 
-  rev_df.to_csv('datasets/revised_covid_19_data.csv',index=False)
-  print("Generated csv file: datasets/revised_covid_19_data.csv")
+  print("Computing the derived metrics...")
+  derived_df = add_derived_metrics(rev_df.copy())
+  write_store(derived_df, 'revised')
+  write_cube(derived_df, 'revised')
+  write_rollups(derived_df, 'revised')
+  if raw_checksums is not None:
+    first_rows = df_bycountry.drop_duplicates('Country/Region')
+    _write_revised_manifest(raw_checksums, dict(zip(first_rows['Country/Region'], first_rows['ObservationDate'])))
   print(rev_df.head())
   print(rev_df.tail())
 
   #return rev_df
 
-def filter_asean_data(df=pd.read_csv('datasets/revised_covid_19_data.csv')):
+def _select_changed_asean_dates(old_df, asean_df):
+  '''
+  Compares the ASEAN rows of the revised columnar store with those of the last run of filter_asean_data()
+  Returns the sorted dates whose rows were added or changed,
+  or None if rows were removed or if a changed date comes before an unchanged one
+  '''
+  old_rows = old_df.assign(country=old_df['country'].astype(str)).set_index(['date','country'])
+  new_rows = asean_df.assign(country=asean_df['country'].astype(str)).set_index(['date','country'])
+  if not old_rows.index.isin(new_rows.index).all():
+    return None
+
+  # Rows missing from the old store are NaN, derived metrics may be NaN in both
+  old_rows = old_rows.reindex(new_rows.index)[new_rows.columns]
+  changed = (old_rows.ne(new_rows) & ~(old_rows.isna() & new_rows.isna())).any(axis=1).values
+  dates = new_rows.index.get_level_values('date')
+  changed_dates = dates[changed].unique().sort_values()
+  if len(changed_dates) and (dates[~dates.isin(changed_dates)] > changed_dates[0]).any():
+    return None
+
+  return changed_dates
+
+def filter_asean_data(df=None, incremental=False):
   '''
-  Filters the revised_covid_19_data by getting only the ASEAN countries
+  Filters the revised dataset by getting only the ASEAN countries
+  Writes their typed copy in the columnar store, its memory-mapped series cube
+  and 'asean_covid_19_data.csv', exported from the same typed data
+  df - typed dataframe with the derived metrics (see columnar_store.to_typed),
+       read from the revised columnar store if not given.
+       The derived metrics of a country only depend on its own rows, so they are kept as they are.
+  incremental - bool, if True nothing is written when the ASEAN rows did not change
+                since the last run, and only the slices of the new or revised dates
+                are appended to the series cube
   returns a pandas dataframe containing only the data on ASEAN nations
   '''
-  print("Filtering ASEAN Countries from 'revised_covid_19_data.csv'...")
+  if df is None:
+    df = load_typed_dataset('revised')
+
+  print("Filtering ASEAN Countries from the revised columnar store...")
   # Set index to country
-  df.set_index('country',inplace=True)
+  asean_df = df.set_index('country').loc[ASEAN_COUNTRIES].reset_index()
+  asean_df['country'] = asean_df['country'].astype(str).astype('category')
+  print("Dataframe for ASEAN Countries complete!")
 
-  # ASEAN Countries
-  asean_countries = ['Indonesia','Thailand','Singapore','Malaysia','Philippines',
-                    'Vietnam','Cambodia','Laos','Brunei','Burma']
+  changed_dates = None
+  if incremental and os.path.exists(STORE_PATHS['asean']):
+    changed_dates = _select_changed_asean_dates(read_store('asean'), asean_df)
+    if changed_dates is not None and not len(changed_dates):
+      print("No new or revised ASEAN rows in the revised columnar store")
+      return
 
-  asean_df = df.loc[asean_countries].copy()
-  asean_df.reset_index(inplace=True)
-  print("Dataframe for ASEAN Countries complete!")
+  write_store(asean_df, 'asean')
+  if changed_dates is None or not append_cube(asean_df[(asean_df['date'] >= changed_dates[0]).values],
+                                              'asean', changed_dates[0]):
+    write_cube(asean_df, 'asean')
 
-  asean_df.to_csv('datasets/asean_covid_19_data.csv',index=False)
-  print("Generated csv file: datasets/revised_covid_19_data.csv")
+  # The csv file is sorted by country, so it is exported again rather than appended to
+  write_csv_atomic(to_csv_columns(asean_df),ASEAN_DATA_PATH,index=False)
+  print("Exported csv file:", ASEAN_DATA_PATH)
   print(asean_df.head())
   print(asean_df.tail())
 
   #return asean_df
 
-# Unhash to run functions and update datasets manually
+# Unhash to run functions and update datasets manually,
+# or run all stages with: python pipeline.py
 #scrape_covid19_data()
+#scrape_covid19_data(incremental=True, refetch_days=3)
 #clean_covid19_data()
-#filter_asean_data()
\ No newline at end of file
+#clean_covid19_data(incremental=True)
+#filter_asean_data()
+#filter_asean_data(incremental=True)
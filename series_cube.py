@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+from derived_metrics import DERIVED_METRICS
+
+# Memory-mapped copies of the dense date x country grids, one directory per dataset
+CUBE_DIRS = {'revised': 'datasets/cube/revised',
+             'revised_weekly': 'datasets/cube/revised_weekly',
+             'revised_monthly': 'datasets/cube/revised_monthly',
+             'asean': 'datasets/cube/asean'}
+COUNTS_FILE = 'counts.npy'   # int32 array of dates x countries x COUNT_METRICS
+RATES_FILE = 'rates.npy'     # float64 array of dates x countries x RATE_METRICS
+DERIVED_FILE = 'derived.npy' # float64 array of dates x countries x DERIVED_METRICS, NaN where undefined
+LABELS_FILE = 'labels.json'  # dates and countries along the first two axes
+
+COUNT_METRICS = ['confirmed','deaths','recovered','active']
+RATE_METRICS = ['death_rate_float','recovery_rate_float']
+
+# Coarser resolutions of the revised dataset, built by the cleaning stage (see build_rollup)
+ROLLUP_FREQUENCIES = {'weekly': 'W-SUN',
+                      'monthly': 'M'}
+
+def _save_array(path, array):
+    with open(path + '.tmp', 'wb') as array_file:
+        np.save(array_file, array)
+    os.replace(path + '.tmp', path)
+
+def _grid_arrays(df, dates, countries):
+    '''
+    Returns the arrays of the cube files of a dataframe, on a grid of sorted dates x countries
+    '''
+    grid_index = pd.MultiIndex.from_product([dates, countries])
+    grid = df.set_index([pd.to_datetime(df['date']), df['country'].astype(str)]).reindex(grid_index)
+    shape = (len(dates), len(countries))
+
+    return {COUNTS_FILE: grid[COUNT_METRICS].fillna(0).to_numpy('int32').reshape(shape + (len(COUNT_METRICS),)),
+            RATES_FILE: grid[RATE_METRICS].fillna(0).to_numpy('float64').reshape(shape + (len(RATE_METRICS),)),
+            DERIVED_FILE: grid[DERIVED_METRICS].to_numpy('float64').reshape(shape + (len(DERIVED_METRICS),))}
+
+def _write_labels(directory, dates, countries):
+    # The labels are replaced last, readers use their modification time as the version
+    labels = {'dates': [date.strftime('%Y-%m-%d') for date in dates],
+              'countries': countries}
+    with open(os.path.join(directory, LABELS_FILE) + '.tmp', 'w') as labels_file:
+        json.dump(labels, labels_file)
+    os.replace(os.path.join(directory, LABELS_FILE) + '.tmp', os.path.join(directory, LABELS_FILE))
+
+def write_cube(df, name):
+    '''
+    Writes a revised (or ASEAN) dataframe as memory-mappable arrays
+    df - dataframe, one row per (date, country) in any order, with the derived metrics
+         (see derived_metrics.add_derived_metrics)
+    name - str, one of the keys of CUBE_DIRS
+    Dates are sorted, countries keep the order in which they first appear in df.
+    '''
+    directory = CUBE_DIRS[name]
+    os.makedirs(directory, exist_ok=True)
+
+    dates = pd.DatetimeIndex(np.sort(pd.to_datetime(df['date']).unique()))
+    countries = list(pd.unique(df['country'].astype(str)))
+    for filename, array in _grid_arrays(df, dates, countries).items():
+        _save_array(os.path.join(directory, filename), array)
+
+    _write_labels(directory, dates, countries)
+    print("Generated series cube:", directory)
+
+def append_cube(df, name, from_date):
+    '''
+    Replaces the dates of a series cube from from_date on by the rows of df.
+    The slices of the earlier dates are copied from the current arrays, nothing else is recomputed.
+    df - dataframe of the dates from from_date on, as for write_cube()
+    name - str, one of the keys of CUBE_DIRS
+    Returns False, without writing anything, if the cube does not exist
+    or if df does not hold the same countries as the cube
+    '''
+    directory = CUBE_DIRS[name]
+    try:
+        with open(os.path.join(directory, LABELS_FILE)) as labels_file:
+            labels = json.load(labels_file)
+    except (OSError, ValueError):
+        return False
+    countries = labels['countries']
+    if set(df['country'].astype(str)) != set(countries):
+        return False
+
+    kept_dates = pd.DatetimeIndex(labels['dates'])
+    kept_dates = kept_dates[kept_dates < pd.Timestamp(from_date)]
+    new_dates = pd.DatetimeIndex(np.sort(pd.to_datetime(df['date']).unique()))
+    for filename, array in _grid_arrays(df, new_dates, countries).items():
+        path = os.path.join(directory, filename)
+        kept_array = np.load(path, mmap_mode='r')[:len(kept_dates)]
+        _save_array(path, np.concatenate([kept_array, array]))
+
+    _write_labels(directory, kept_dates.append(new_dates), countries)
+    print(f"Appended {len(new_dates)} dates to series cube:", directory)
+
+    return True
+
+def build_rollup(df, resolution):
+    '''
+    Reduces a revised dataframe to one date per week or month.
+    The counts are cumulative, so each period keeps the rows of its last observed date
+    (the last period may end before the calendar week or month does).
+    The derived metrics are those of that date too, e.g. the rolling means of its last days.
+    df - dataframe, dense grid with one row per (date, country)
+    resolution - str, one of the keys of ROLLUP_FREQUENCIES
+    Returns a pandas dataframe with the same columns as df
+    '''
+    dates = pd.to_datetime(df['date'])
+    periods = dates.dt.to_period(ROLLUP_FREQUENCIES[resolution])
+    last_dates = dates.groupby(periods).transform('max')
+
+    return df[(dates == last_dates).values]
+
+def write_rollups(df, name='revised'):
+    '''
+    Writes the weekly and monthly rollups of a dataframe as series cubes
+    named '<name>_weekly' and '<name>_monthly'
+    '''
+    for resolution in ROLLUP_FREQUENCIES:
+        write_cube(build_rollup(df, resolution), f'{name}_{resolution}')
+
+def append_rollups(df, name, from_date):
+    '''
+    Updates the weekly and monthly rollups of a dataframe from from_date on,
+    only the periods from the one holding from_date are built again (see append_cube)
+    df - dataframe, dense grid with one row per (date, country), holding at least
+         all the dates of the week and of the month of from_date
+    Returns False if a rollup could not be appended to, write_rollups() is then needed
+    '''
+    dates = pd.to_datetime(df['date'])
+    for resolution, frequency in ROLLUP_FREQUENCIES.items():
+        period_start = pd.Timestamp(from_date).to_period(frequency).start_time
+        rollup_df = build_rollup(df[(dates >= period_start).values], resolution)
+        if not append_cube(rollup_df, f'{name}_{resolution}', period_start):
+            return False
+
+    return True
+
+class SeriesCube:
+    '''
+    Read-only view of the arrays written by write_cube().
+    The arrays are memory-mapped, so every process opening the same files
+    (e.g. the gunicorn workers) shares their pages through the OS page cache.
+    A country series or a single date is a plain slice, no dataframe is scanned.
+    It answers the same lookups as a DataStore, so the dashboard can be served
+    without a private pandas copy of the dataset in each worker.
+    '''
+    def __init__(self, name):
+        directory = CUBE_DIRS[name]
+        with open(os.path.join(directory, LABELS_FILE)) as labels_file:
+            labels = json.load(labels_file)
+
+        self.dates = pd.DatetimeIndex(labels['dates'])
+        self.countries = labels['countries']
+        self.counts = np.load(os.path.join(directory, COUNTS_FILE), mmap_mode='r')
+        self.rates = np.load(os.path.join(directory, RATES_FILE), mmap_mode='r')
+        self.derived = np.load(os.path.join(directory, DERIVED_FILE), mmap_mode='r')
+
+        self.latest_date = self.dates[-1]
+
+        self._date_positions = {date: i for i, date in enumerate(self.dates)}
+        self._country_positions = {country: i for i, country in enumerate(self.countries)}
+
+    def _frame(self, dates, countries, counts, rates, derived):
+        columns = {'date': dates, 'country': countries}
+        columns.update((metric, np.array(counts[:, k])) for k, metric in enumerate(COUNT_METRICS))
+        columns.update((metric, np.array(rates[:, k])) for k, metric in enumerate(RATE_METRICS))
+        columns.update((metric, np.array(derived[:, k])) for k, metric in enumerate(DERIVED_METRICS))
+
+        return pd.DataFrame(columns)
+
+    def date_at(self, date_index):
+        '''
+        Returns the date at a position of the sorted dates, as the slider counts them
+        '''
+        return self.dates[date_index]
+
+    def country_frame(self, country):
+        '''
+        Returns the series of one country, one row per date, with the columns
+        'date', 'country' + COUNT_METRICS + RATE_METRICS + DERIVED_METRICS
+        An unknown country returns an empty dataframe.
+        '''
+        i = self._country_positions.get(country)
+        if i is None:
+            return self._frame([], [], self.counts[:0, 0], self.rates[:0, 0], self.derived[:0, 0])
+
+        return self._frame(self.dates, country, self.counts[:, i], self.rates[:, i], self.derived[:, i])
+
+    def country_matrix(self, countries, metric):
+        '''
+        Returns one metric of several countries in a single slice of the cube,
+        as a dataframe of dates x countries. Unknown countries are left out.
+        metric - str, one of COUNT_METRICS, RATE_METRICS or DERIVED_METRICS
+        '''
+        countries = [country for country in countries if country in self._country_positions]
+        positions = [self._country_positions[country] for country in countries]
+        if metric in COUNT_METRICS:
+            values = self.counts[:, positions, COUNT_METRICS.index(metric)]
+        elif metric in RATE_METRICS:
+            values = self.rates[:, positions, RATE_METRICS.index(metric)]
+        else:
+            values = self.derived[:, positions, DERIVED_METRICS.index(metric)]
+
+        return pd.DataFrame(values, index=self.dates, columns=countries)
+
+    def date_frame(self, date):
+        '''
+        Returns all countries on one date, in the order of the cube, with the columns
+        'date', 'country' + COUNT_METRICS + RATE_METRICS + DERIVED_METRICS
+        date - a datetime or a 'str' on this format 'MM/DD/YYYY'
+        An unknown date returns an empty dataframe.
+        '''
+        date = pd.Timestamp(date)
+        d = self._date_positions.get(date)
+        if d is None:
+            return self._frame([], [], self.counts[0, :0], self.rates[0, :0], self.derived[0, :0])
+
+        return self._frame(date, self.countries, self.counts[d], self.rates[d], self.derived[d])
+
+    def latest_rows(self, country):
+        '''
+        Returns the row of a country on the latest date as a one-row dataframe
+        '''
+        i = self._country_positions.get(country)
+        if i is None:
+            return self._frame([], [], self.counts[:0, 0], self.rates[:0, 0], self.derived[:0, 0])
+
+        return self._frame(self.latest_date, [country], self.counts[-1, i:i + 1], self.rates[-1, i:i + 1],
+                           self.derived[-1, i:i + 1])
@@ -0,0 +1,30 @@
+import os
+import shutil
+import sys
+import pytest
+
+# The modules of the dashboard live at the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from dataset_loader import clear_datasets
+
+# Input files of the clean stage (see pipeline.py)
+CLEAN_INPUTS = ['datasets/covid_19_data.csv',
+                'datasets/country_names.json',
+                'datasets/pop2020_estimates.csv']
+
+@pytest.fixture
+def dataset_dir(tmp_path, monkeypatch):
+    '''
+    Runs a test from a temporary directory holding a copy of the inputs of the clean stage,
+    so the datasets written by the pipeline functions never touch the ones of the repository
+    Returns the path of the temporary directory
+    '''
+    os.makedirs(tmp_path / 'datasets')
+    for path in CLEAN_INPUTS:
+        shutil.copyfile(os.path.join(REPO_DIR, path), tmp_path / path)
+    monkeypatch.chdir(tmp_path)
+    clear_datasets()
+    yield tmp_path
+    clear_datasets()
@@ -0,0 +1,78 @@
+import importlib
+import json
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Outputs of the callbacks called by the test, as the keys of app.callback_map
+LINEPLOT_OUTPUT = 'selected-country.figure'
+SUMMARY_OUTPUT = 'country-summary.children'
+ASEAN_STANDINGS_OUTPUT = '..asean-table.children...asean-bubble.figure..'
+
+@pytest.fixture(scope='module')
+def server_app():
+    '''
+    Imports app.py from the repository root with the ASEAN slider states built by the server,
+    so that update_asean_standings is registered as a callback, and without the refresher thread
+    Returns the app module
+    '''
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('ASEAN_SLIDER_MODE', 'server')
+        monkeypatch.setenv('DATA_REFRESH_SECONDS', '0')
+        monkeypatch.chdir(REPO_DIR)
+        sys.modules.pop('app', None)
+        yield importlib.import_module('app')
+        sys.modules.pop('app', None)
+
+def test_asean_standings_callback_is_served(server_app):
+    client = server_app.server.test_client()
+    for date_index in [None, 0]:
+        response = client.post('/_dash-update-component',
+                               json={'output': ASEAN_STANDINGS_OUTPUT,
+                                     'inputs': [{'id': 'asean-slider', 'property': 'value', 'value': date_index},
+                                                {'id': 'asean-table-view', 'property': 'value', 'value': 'cumulative'}],
+                                     'changedPropIds': ['asean-slider.value']})
+
+        assert response.status_code == 200
+        outputs = json.loads(response.data)['response']
+        assert set(outputs) == {'asean-table', 'asean-bubble'}
+
+def test_callbacks_are_consistent_across_threads(server_app, threads=16, calls=600, countries=3, dates=6, seed=0):
+    '''
+    Calls the registered callbacks from many threads at once, as a threaded worker does,
+    and checks that every output is the one the same call returns when run alone.
+    The caches are cleared first so that the threads also build the outputs concurrently.
+    A few countries and dates are sampled so that the threads often request the same outputs
+    (each distinct figure takes plotly a few hundred milliseconds to build).
+    '''
+    callback_map = server_app.app.callback_map
+    snapshot = server_app.refresher.snapshot
+    rng = random.Random(seed)
+    countries = rng.sample(list(snapshot.df_store.countries), countries)
+    date_indices = [None] + rng.sample(range(len(snapshot.asean_store.dates)), dates - 1)
+    arguments = ([(LINEPLOT_OUTPUT, (rng.choice(countries), rng.choice(['auto', 'weekly']),
+                                     rng.choice(['cumulative', 'new']), None))
+                  for _ in range(calls // 3)] +
+                 [(SUMMARY_OUTPUT, (rng.choice(countries),)) for _ in range(calls // 3)] +
+                 [(ASEAN_STANDINGS_OUTPUT, (rng.choice(date_indices), rng.choice(['cumulative', 'new'])))
+                  for _ in range(calls // 3)])
+    rng.shuffle(arguments)
+
+    def call(output_args):
+        output, args = output_args
+        return callback_map[output]['callback'](*args)
+
+    expected = {}
+    for output_args in arguments:
+        if output_args not in expected:
+            expected[output_args] = call(output_args)
+    server_app.lineplot_cache.clear()
+    server_app.asean_slider_state.cache_clear()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for output_args, response in zip(arguments, pool.map(call, arguments)):
+            assert response == expected[output_args], f"inconsistent output of {output_args}"
@@ -0,0 +1,60 @@
+import filecmp
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from columnar_store import read_store
+from series_cube import SeriesCube
+from revise_covid19 import build_dense_grid, clean_covid19_data, RAW_DATA_PATH, REVISED_DATA_PATH
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_build_dense_grid_fills_missing_pairs():
+    df_bycountry = pd.DataFrame({'ObservationDate': ['01/22/2020', '01/22/2020', '01/23/2020'],
+                                 'Country/Region': ['Japan', 'China', 'China'],
+                                 'Confirmed': [2.0, 548.0, 643.0],
+                                 'Deaths': [0.0, 17.0, 18.0],
+                                 'Recovered': [0.0, 28.0, 30.0],
+                                 'active': [2.0, 503.0, 595.0],
+                                 'death_rate_float': [0.0, 17 / 548, 18 / 643],
+                                 'recovery_rate_float': [0.0, 28 / 548, 30 / 643]})
+
+    rev_df = build_dense_grid(df_bycountry)
+
+    assert rev_df[['date', 'country']].values.tolist() == [['01/22/2020', 'Japan'],
+                                                           ['01/22/2020', 'China'],
+                                                           ['01/23/2020', 'Japan'],
+                                                           ['01/23/2020', 'China']]
+    assert rev_df['confirmed'].tolist() == [2, 548, 0, 643]
+    assert rev_df['confirmed'].dtype == 'int64'
+    assert rev_df.loc[2, ['deaths', 'recovered', 'active', 'death_rate_float']].tolist() == [0, 0, 0, 0.0]
+
+@pytest.mark.usefixtures('dataset_dir')
+def test_clean_covid19_data_matches_committed_dataset():
+    clean_covid19_data()
+
+    committed_path = os.path.join(REPO_DIR, REVISED_DATA_PATH)
+    assert filecmp.cmp(REVISED_DATA_PATH, committed_path, shallow=False)
+
+@pytest.mark.usefixtures('dataset_dir')
+def test_incremental_clean_appends_the_new_date():
+    raw_df = pd.read_csv(RAW_DATA_PATH, dtype=str)
+    last_date = raw_df['ObservationDate'].iloc[-1]
+    raw_df[raw_df['ObservationDate'] != last_date].to_csv(RAW_DATA_PATH, index=False)
+    clean_covid19_data()
+
+    raw_df.to_csv(RAW_DATA_PATH, index=False)
+    clean_covid19_data(incremental=True)
+
+    committed_path = os.path.join(REPO_DIR, REVISED_DATA_PATH)
+    assert filecmp.cmp(REVISED_DATA_PATH, committed_path, shallow=False)
+    incremental_store_df = read_store('revised')
+    incremental_cubes = {name: SeriesCube(name) for name in ['revised', 'revised_weekly', 'revised_monthly']}
+
+    clean_covid19_data()
+    pd.testing.assert_frame_equal(incremental_store_df, read_store('revised'))
+    for name, incremental_cube in incremental_cubes.items():
+        cube = SeriesCube(name)
+        assert incremental_cube.dates.equals(cube.dates)
+        assert np.array_equal(incremental_cube.counts, cube.counts)
+        assert np.array_equal(incremental_cube.derived, cube.derived, equal_nan=True)
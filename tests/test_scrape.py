@@ -0,0 +1,67 @@
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from report_sources import RawCsvReportSource
+from revise_covid19 import scrape_covid19_data, RAW_DATA_PATH
+
+# Daily reports served by the test server, the report of 01-24-2020 is missing (404)
+# and the country column was renamed in later reports
+REPORTS = {'01-22-2020.csv': "Province/State,Country/Region,Last Update,Confirmed,Deaths,Recovered\n"
+                             "Hubei,Mainland China,1/22/2020 17:00,444,17,28\n"
+                             "Beijing,Mainland China,1/22/2020 17:00,14,,\n"
+                             ",Japan,1/22/2020 17:00,2,,\n",
+           '01-23-2020.csv': "Province/State,Country/Region,Last Update,Confirmed,Deaths,Recovered\n"
+                             "Hubei,Mainland China,1/23/20 17:00,444,17,28\n"
+                             "Beijing,Mainland China,1/23/20 17:00,22,,\n"
+                             ",Japan,1/23/20 17:00,1,,\n"
+                             ",Thailand,1/23/20 17:00,3,,\n",
+           '01-25-2020.csv': "FIPS,Admin2,Province_State,Country_Region,Last_Update,Lat,Long_,Confirmed,Deaths,Recovered,Active,Combined_Key\n"
+                             ",,Hubei,China,2020-01-25 17:00:00,30.9,112.2,1052,52,42,958,\"Hubei, China\"\n"
+                             ",,,\"Korea, South\",2020-01-25 17:00:00,36.0,128.0,2,0,0,2,\"Korea, South\"\n"
+                             ",,,Japan,2020-01-25 17:00:00,36.2,138.2,2,0,0,2,Japan\n"}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def report_server(tmp_path):
+    '''
+    Serves REPORTS as raw csv files from a local http.server
+    Returns the base url of the daily reports
+    '''
+    reports_dir = tmp_path / 'daily_reports'
+    reports_dir.mkdir()
+    for filename, text in REPORTS.items():
+        (reports_dir / filename).write_text(text)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(reports_dir)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def _scrape(base_url, **options):
+    scrape_covid19_data(source=RawCsvReportSource(base_url, end_date='01-26-2020'),
+                        use_cache=False, chunk_size=2, **options)
+    with open(RAW_DATA_PATH) as csv_file:
+        return csv_file.read()
+
+@pytest.mark.usefixtures('dataset_dir')
+def test_concurrent_scrape_matches_serial_scrape(report_server):
+    serial_csv = _scrape(report_server, workers=1, processes=1)
+    concurrent_csv = _scrape(report_server, workers=4, processes=2)
+
+    assert concurrent_csv == serial_csv
+    # Country names are made canonical through datasets/country_names.json
+    assert serial_csv.splitlines() == ['ObservationDate,Country/Region,Confirmed,Deaths,Recovered',
+                                       '01/22/2020,China,458.0,17.0,28.0',
+                                       '01/22/2020,Japan,2.0,0.0,0.0',
+                                       '01/23/2020,China,466.0,17.0,28.0',
+                                       '01/23/2020,Japan,1.0,0.0,0.0',
+                                       '01/23/2020,Thailand,3.0,0.0,0.0',
+                                       '01/25/2020,China,1052.0,52.0,42.0',
+                                       '01/25/2020,Japan,2.0,0.0,0.0',
+                                       '01/25/2020,South Korea,2.0,0.0,0.0']
@@ -1,8 +1,9 @@
 import plotly.graph_objects as go
 import pandas as pd 
 import random
-from datetime import datetime
 from get_data import get_global_data
+from downsampling import downsample_series
+from columnar_store import rows_on_date
 
 
 ### GENERATE HEXCOLOR FUNCTION###
@@ -18,42 +19,132 @@ def generate_hexcolors(counts=10):
     rgb = lambda: f"rgb({random.randint(100,255)},{random.randint(100,255)},{random.randint(100,255)})"
     return [rgb() for _ in range(counts)]
 
-def load_lineplot_fig(df,country):
+# Most points drawn per trace by the line plot when its resolution is 'auto'
+LINEPLOT_MAX_POINTS = 120
+# Traces of the line plot for each choice of metric: title, axis title and (column, name, color) of the traces.
+# The columns are stored by the cleaning stage (see derived_metrics.py), switching metric reads other columns.
+LINEPLOT_METRICS = {'cumulative': ("Cumulative Counts", 'Counts',
+                                   [('confirmed','Confirmed','green'), ('deaths','Deaths','red'), ('recovered','Recovered','blue')]),
+                    'new': ("New Cases (7-day average)", 'Daily Counts',
+                            [('new_confirmed_avg7','Confirmed','green'), ('new_deaths_avg7','Deaths','red'), ('new_recovered_avg7','Recovered','blue')]),
+                    'per_million': ("Counts per Million People", 'Counts per Million',
+                                    [('confirmed_per_million','Confirmed','green'), ('deaths_per_million','Deaths','red')])}
+
+def _lineplot_frame(df, country, date_range=None):
+    if isinstance(df, pd.DataFrame):
+        df_bycountry = df[df['country'] == country].copy()
+    else:
+        df_bycountry = df.country_frame(country)
+
+    if date_range is not None:
+        dates = pd.to_datetime(df_bycountry['date'])
+        df_bycountry = df_bycountry[(dates >= pd.Timestamp(date_range[0])) & (dates <= pd.Timestamp(date_range[1]))]
+
+    return df_bycountry
+
+def load_lineplot_fig(df,country,resolution='auto',rollups=None,date_range=None,metric='cumulative'):
     '''
     Load a lineplot figure to be filtered by country
+    df - dataframe of the revised dataset, or its SeriesCube or DataStore
+    resolution - str, 'daily', 'weekly', 'monthly' or 'auto' for the finest resolution
+                 that draws at most LINEPLOT_MAX_POINTS dates of the visible range
+    rollups - dictionary of {'weekly': ..., 'monthly': ...} dataframes or SeriesCubes
+              built by the cleaning stage (see dataset_loader.load_rollups),
+              the daily data is drawn if the chosen resolution is missing
+    date_range - (start, end) dates of the visible range, defaults to the whole series
+    metric - str, one of the keys of LINEPLOT_METRICS
+    '''
+    rollups = rollups or {}
+    df_bycountry = _lineplot_frame(df, country, date_range)
+    if resolution == 'auto':
+        resolution = 'daily'
+        for coarser in ['weekly', 'monthly']:
+            if len(df_bycountry) <= LINEPLOT_MAX_POINTS or coarser not in rollups:
+                break
+            df_bycountry = _lineplot_frame(rollups[coarser], country, date_range)
+            resolution = coarser
+    elif resolution in rollups:
+        df_bycountry = _lineplot_frame(rollups[resolution], country, date_range)
+    else:
+        resolution = 'daily'
+
+    # Dates keep their year, plotly labels the axis accordingly
+    x_dates = pd.to_datetime(df_bycountry['date'])
+
+    title, yaxis_title, traces = LINEPLOT_METRICS[metric]
+    data = [go.Scatter(x= x_dates,
+                       y= df_bycountry[column],
+                       mode='lines', name=name,
+                       marker={'color':color}
+                       ) for column, name, color in traces]
+
+    title = f"{title} from {country}"
+    if resolution != 'daily':
+        title += f" ({resolution})"
+
+    layout = go.Layout(title= title,
+                    xaxis= {'title': 'Observation Dates'},
+                    yaxis= {'title': yaxis_title},
+                    hovermode= 'x',
+                    # The zoom of the user is kept when the figure of the visible range replaces it
+                    uirevision= f"{country} {metric}"
+                    )
+
+    return go.Figure(data=data,layout=layout)
+
+# Most points drawn per country by the comparison plot, whatever the number of countries
+COMPARISON_MAX_POINTS = 150
+# Most countries drawn at once by the comparison plot
+COMPARISON_MAX_COUNTRIES = 50
+
+def _comparison_matrix(df, countries, metric):
+    if isinstance(df, pd.DataFrame):
+        df_bycountries = df[df['country'].isin(countries)]
+        matrix = df_bycountries.pivot(index='date', columns='country', values=metric)
+        matrix.index = pd.to_datetime(matrix.index)
+        return matrix[[country for country in countries if country in matrix.columns]]
+
+    return df.country_matrix(countries, metric)
+
+def load_comparison_fig(df,countries,metric='confirmed',max_points=COMPARISON_MAX_POINTS):
     '''
-    df_bycountry = df[df['country'] == country].copy()
-
-    x_dates = [str(date)[:5] for date in df_bycountry['date']]
-
-    confirmed_trace = go.Scatter(x= x_dates,
-                                 y= df_bycountry['confirmed'],
-                                 mode='lines', name='Confirmed',
-                                 marker={'color':'green'}
-                                 )
-    deaths_trace = go.Scatter(x= x_dates,
-                              y= df_bycountry['deaths'],
-                              mode='lines', name='Deaths',
-                              marker={'color':'red'}
-                              )
-    recovered_trace = go.Scatter(x= x_dates,
-                                y= df_bycountry['recovered'],
-                                mode='lines', name='Recovered',
-                                marker={'color':'blue'}
-                                )
-
-    data = [confirmed_trace, deaths_trace, recovered_trace]
-
-    layout = go.Layout(title= f"Cumulative Counts from {country}",
+    Load a lineplot figure comparing one metric of several countries
+    df - dataframe of the revised dataset, or its SeriesCube or DataStore
+    countries - list of country names, only the first COMPARISON_MAX_COUNTRIES are drawn
+    metric - str, 'confirmed', 'deaths', 'recovered' or 'active'
+    max_points - int, most points drawn per country, the series are downsampled
+                 with LTTB (see downsampling.py) so that their peaks are kept
+    The traces are drawn with WebGL (go.Scattergl) to stay fast with many countries.
+    '''
+    matrix = _comparison_matrix(df, list(countries)[:COMPARISON_MAX_COUNTRIES], metric)
+
+    # Traces as dictionaries of go.Scattergl, validated once by go.Figure instead of twice
+    data = []
+    for country in matrix.columns:
+        series = downsample_series(matrix[country], max_points)
+        data.append({'type': 'scattergl',
+                     'x': series.index,
+                     'y': series.values,
+                     'mode': 'lines', 'name': country
+                     })
+
+    layout = go.Layout(title= f"Cumulative {metric.capitalize()} Counts by Country",
                     xaxis= {'title': 'Observation Dates'},
                     yaxis= {'title': 'Counts'},
-                    hovermode= 'x'
+                    hovermode= 'closest'
                     )
 
     return go.Figure(data=data,layout=layout)
 
 def load_bubbleplot_fig(df,date,color_settings):
-    df_bydate = df[df['date'] == date].copy()
+    '''
+    Load a bubbleplot figure of the countries on a chosen date
+    df - dataframe of the ASEAN dataset, or its SeriesCube or DataStore
+    '''
+    if isinstance(df, pd.DataFrame):
+        df_bydate = rows_on_date(df, date)
+    else:
+        df_bydate = df.date_frame(date)
     #df_bydate = df_bydate[df_bydate['country'] != 'Others'] # Exlude the 'Others'
     # Limit display to only top 10 countries based on active cases
     #df_bydate = df_bydate.nlargest(10,'active')
@@ -72,8 +163,7 @@ def load_bubbleplot_fig(df,date,color_settings):
                         )
 
     # Format Date
-    parsed_date = datetime.strptime(str(date)[:10],"%m/%d/%Y")
-    revised_date = datetime.strftime(parsed_date,"%B %-d, %Y")
+    revised_date = pd.Timestamp(date).strftime("%B %-d, %Y")
 
     layout = go.Layout( title = f'COVID-19 Bubble Plot ({str(revised_date)})',
                         xaxis = dict(   title ='Recovery Rate in %',
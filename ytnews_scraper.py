@@ -3,6 +3,8 @@ import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
+from http_cache import HttpCache
+from dataset_loader import write_csv_atomic
 
 # Create a dictionary of urls
 _news_channels_ = [{'base': 'Singapore',
@@ -46,17 +48,28 @@ _news_channels_ = [{'base': 'Singapore',
                  }
                 ]
 
-def get_latest_ytnewslinks(channel_url):
+def _get_page_text(url, cache=None):
     '''
-    Scrapes YouTube for the URLs of the latest video uploads(news) from a news channel
-    Returns a pandas dataframe containing the info on the news.
+    GET request on url, through the HttpCache if given
+    Returns the page as text
     '''
+    if cache is not None:
+        return cache.get_text(url)
+
     # Create requests object
-    res = requests.get(channel_url)
+    res = requests.get(url)
     res.raise_for_status()
 
+    return res.text
+
+def get_latest_ytnewslinks(channel_url, cache=None):
+    '''
+    Scrapes YouTube for the URLs of the latest video uploads(news) from a news channel
+    cache - HttpCache, optional cache used for the channel and video pages
+    Returns a pandas dataframe containing the info on the news.
+    '''
     # Create a BeautifulSoup object: soup
-    soup = BeautifulSoup(res.text,'lxml')
+    soup = BeautifulSoup(_get_page_text(channel_url, cache),'lxml')
     
     # Get 5 recent news data
     contents = soup.find_all('h3', class_="yt-lockup-title")[:5]
@@ -81,12 +94,8 @@ def get_latest_ytnewslinks(channel_url):
     for item in news_dict['url']:
         video_url = item
 
-        # Create requests object
-        vid_res = requests.get(video_url)
-        vid_res.raise_for_status()
-
         # Create a BeautifulSoup object: soup
-        vid_soup = BeautifulSoup(vid_res.text,'lxml')
+        vid_soup = BeautifulSoup(_get_page_text(video_url, cache),'lxml')
         
         # Parse the soup for the publish date
         for meta in vid_soup.html.body.find_all('meta'):
@@ -108,20 +117,24 @@ def get_all_latestnews():
     listed within _news_channels_
     '''
     df_list = []
+    cache = HttpCache()
 
     for i in range(len(_news_channels_)):
         try:
-            df_list.append(get_latest_ytnewslinks(channel_url=_news_channels_[i]['yturl']))
+            df_list.append(get_latest_ytnewslinks(channel_url=_news_channels_[i]['yturl'], cache=cache))
         except:
             print("\nUnable to scrape from", _news_channels_[i]['channel'],'...\n')
             pass
 
+    cache.save()
+    print("HTTP cache:", cache.stats())
+
     df = pd.concat(df_list, axis=0)
     df.sort_values(by='sortkey',ascending=False,inplace=True)
     df.reset_index(inplace=True)
     df.drop(columns=['index'],inplace=True)
     #df.to_csv('datasets/news' + ''.join(str(datetime.utcnow()).split(":")[:-1]) + '.csv')
-    df.to_csv('datasets/news.csv')
+    write_csv_atomic(df, 'datasets/news.csv')
     print("News Dataframe complete!")
     print("Generated csv file: datasets/news.csv")
 